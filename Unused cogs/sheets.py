@@ -1,11 +1,10 @@
 import discord
 from discord.ext import commands, tasks
-import pandas as pd
 import datetime as DT
 import urllib.request
 import json
-import pygsheets
-import statistics
+from helpers.stats import robust_mean
+from helpers import query
 
 
 class Sheets(commands.Cog):
@@ -109,7 +108,7 @@ class Sheets(commands.Cog):
         """Update Google Sheets with weekly average prices.
 
         - Average of all 5 cities except Caerleon and Black Market.
-        - Reject outliers.
+        - Reject outliers (helpers.stats.robust_mean).
         - Only self.adminUsers can run this command.
         """
 
@@ -118,19 +117,11 @@ class Sheets(commands.Cog):
         if str(ctx.author) not in self.adminUsers:
             return
 
-        def reject_outliers(data):
-            d = [abs(i - statistics.median(data)) for i in data]
-            mdev = statistics.median(d)
-            s = [i / mdev if mdev else 0 for i in d]
-            m = 10
-            indices = [i for (i, val) in enumerate(s) if val < m]
-
-            newData = [data[i] for i in indices]
-            return newData, indices
-
         await ctx.send("Updating weekly average prices. This might take awhile.")
 
-        # Connect to Google Sheets
+        # Connect to Google Sheets (pygsheets only imported when needed)
+        import pygsheets
+
         gc = pygsheets.authorize(service_account_file=self.serviceFile)
         sh = gc.open(self.spreadsheet)
         wks = sh.worksheet_by_title(self.worksheet)
@@ -173,12 +164,9 @@ class Sheets(commands.Cog):
                     pass
 
             try:
-                # Reject outliers
-                itemPrices, indices = reject_outliers(itemPrices)
-
-                # Find average and append it to avgPrices
+                # Find average without outliers and append it to avgPrices
                 # Each element in avgPrices need to be in a list (Google Sheets requirement)
-                average = int(statistics.mean(itemPrices))
+                average = int(robust_mean(itemPrices))
                 avgPrices.append([average])
 
             # If itemPrices is []
@@ -263,7 +251,9 @@ class Sheets(commands.Cog):
             )
             quantity = "Quantity"
 
-        # Read CSV with pandas
+        # Read CSV with pandas (only imported when needed)
+        import pandas as pd
+
         df = pd.read_csv(URL, header=2)
 
         # Drop 0 Remaining and nan values
@@ -278,32 +268,12 @@ class Sheets(commands.Cog):
         # Discord embed
         em = discord.Embed(title=title, description=self.marketURL, colour=color)
 
-        # Tier and enchantment names to remove
-        tierNames = [
-            "Beginner's",
-            "Novice's",
-            "Journeyman's",
-            "Adept's",
-            "Expert's",
-            "Master's",
-            "Grandmaster's",
-            "Elder's",
-            "Beginner",
-            "Novice",
-            "Journeyman",
-            "Adept",
-            "Expert",
-            "Master",
-            "Grandmaster",
-            "Elder",
-            "Stonestream",
-            "Rushwater",
-            "Thunderfall",
-        ]
-        enchantNames = ["Uncommon", "Rare", "Exceptional"]
+        # Tier and enchantment names to remove (same as item matching, helpers.query)
+        tierNames = query.tierNames + ["Stonestream", "Rushwater", "Thunderfall"]
+        enchantNames = query.enchantNames
 
         # Enchantment labels at end of item ID to know if item has enchantment
-        enchantNumbers = ["@1", "@2", "@3"]
+        enchantNumbers = query.enchantNumbers
 
         # Express data in columns for Discord embed
         embedItemString = ""
@@ -0,0 +1,12 @@
+"""Offline benchmarks of the bot's hot paths.
+
+- Runs against JSON fixtures in /benchmarks/fixtures, no Discord or API needed.
+- Fixtures are recorded from the live APIs, or synthesized (see fixtures.py).
+- Timings and memory peaks of each stage are compared against a stored baseline
+    (see run.py).
+"""
+
+import os
+
+# Recorded/synthesized JSON fixtures are kept in /benchmarks/fixtures
+fixturesPath = os.path.dirname(os.path.realpath(__file__)) + "/fixtures"
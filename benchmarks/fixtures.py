@@ -0,0 +1,284 @@
+"""JSON fixtures of the APIs used by the bot, for the offline benchmarks.
+
+- Usage: python -m benchmarks.fixtures record [--item T4_BAG] [--guild <name>]
+    Records fixtures from the live APIs (Data Project, gameinfo, ao-bin-dumps).
+- Usage: python -m benchmarks.fixtures synthesize [--seed 0]
+    Writes synthetic fixtures in the same formats, no network needed.
+
+Fixtures (in /benchmarks/fixtures):
+    - items.json: item list (ao-bin-dumps formatted/items.json).
+    - prices.json: current prices of one item (prices API).
+    - charts.json: 7 days hourly historical prices of one item (charts API).
+    - members.json: members of one guild (gameinfo guild members API).
+    - gold.json: 30 days gold prices (gold API).
+"""
+
+import argparse
+import datetime as DT
+import json
+import os
+import random
+import urllib.request
+from benchmarks import fixturesPath
+
+# Same URLs as the cogs
+itemListURL = "https://raw.githubusercontent.com/broderickhyman/ao-bin-dumps/master/formatted/items.json"
+pricesURL = "https://www.albion-online-data.com/api/v2/stats/prices/"
+chartsURL = "https://www.albion-online-data.com/api/v2/stats/charts/"
+goldURL = "https://www.albion-online-data.com/api/v2/stats/gold?date="
+searchURL = "https://gameinfo.albiononline.com/api/gameinfo/search?q="
+guildURL = "https://gameinfo.albiononline.com/api/gameinfo/guilds/"
+locations = "Caerleon,Lymhurst,Martlock,Bridgewatch,FortSterling,Thetford,ArthursRest,MerlynsRest,MorganasRest,BlackMarket"
+
+# City names as returned by the APIs
+cities = [
+    "Arthurs Rest",
+    "Black Market",
+    "Bridgewatch",
+    "Caerleon",
+    "Fort Sterling",
+    "Lymhurst",
+    "Martlock",
+    "Merlyns Rest",
+    "Morganas Rest",
+    "Thetford",
+]
+
+timeFormat = "%Y-%m-%dT%H:%M:%S"
+
+
+def load(name):
+    """Returns the parsed JSON fixture name, e.g. load('items')."""
+
+    try:
+        with open(f"{fixturesPath}/{name}.json", "rb") as f:
+            return json.loads(f.read().decode())
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Fixture {name}.json not found, run "
+            "'python -m benchmarks.fixtures record' (or 'synthesize') first."
+        )
+
+
+def save(name, data):
+    """Save data as JSON fixture name."""
+
+    os.makedirs(fixturesPath, exist_ok=True)
+    with open(f"{fixturesPath}/{name}.json", "w") as f:
+        json.dump(data, f)
+
+
+def get_json(url):
+    """Returns the parsed JSON response of url (blocking, recording only)."""
+
+    request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.loads(response.read().decode())
+
+
+def record(item="T4_BAG", guild="Pangolin"):
+    """Record all fixtures from the live APIs.
+
+    - prices.json and charts.json are of item.
+    - members.json is of the first guild found with the name guild.
+    """
+
+    today = DT.datetime.utcnow()
+
+    print("Recording items.json")
+    save("items", get_json(itemListURL))
+
+    print(f"Recording prices.json ({item})")
+    save("prices", get_json(pricesURL + item + "?locations=" + locations))
+
+    print(f"Recording charts.json ({item})")
+    date = (today - DT.timedelta(days=7)).strftime("%m-%d-%Y")
+    save(
+        "charts",
+        get_json(
+            chartsURL
+            + item
+            + "?date="
+            + date
+            + "&locations="
+            + locations
+            + "&time-scale=1"
+        ),
+    )
+
+    print(f"Recording members.json ({guild})")
+    guildID = get_json(searchURL + guild.replace(" ", "%20"))["guilds"][0]["Id"]
+    save("members", get_json(guildURL + guildID + "/members"))
+
+    print("Recording gold.json")
+    date = (today - DT.timedelta(days=30)).strftime("%m-%d-%Y")
+    save("gold", get_json(goldURL + date))
+
+
+def synthesize(seed=0):
+    """Write synthetic fixtures, in the same formats as the live APIs.
+
+    - Sizes are close to the live ones (about 8,000 items, 300 guild members).
+    - Same seed always gives the same fixtures, so results are comparable.
+    """
+
+    rng = random.Random(seed)
+    end = DT.datetime(2020, 7, 8)
+
+    # Item list, with tiers, enchantments and localized names
+    tiers = [
+        "Beginner's",
+        "Novice's",
+        "Journeyman's",
+        "Adept's",
+        "Expert's",
+        "Master's",
+        "Grandmaster's",
+        "Elder's",
+    ]
+    languages = ["EN-US", "DE-DE", "FR-FR", "RU-RU", "PL-PL", "ES-ES", "PT-BR"]
+    languages += ["ZH-CN", "KO-KR", "IT-IT", "JA-JP", "ZH-TW", "ID-ID"]
+    words = ["Bag", "Cape", "Sword", "Staff", "Bow", "Robe", "Helmet", "Shoes"]
+    words += ["Jacket", "Hood", "Shield", "Axe", "Hammer", "Spear", "Dagger"]
+    words += ["Planks", "Metal Bar", "Leather", "Cloth", "Potion", "Stew"]
+    items = []
+    for i in range(270):
+        base = f"ITEM{i}"
+        name = " ".join(rng.sample(words, 2))
+        for tier in range(1, 9):
+            for enchant in range(4 if tier >= 4 else 1):
+                uniqueName = f"T{tier}_{base}" + (f"@{enchant}" if enchant else "")
+                itemName = f"{tiers[tier - 1]} {name}"
+                items.append(
+                    {
+                        "Index": str(len(items)),
+                        "UniqueName": uniqueName,
+                        "LocalizedNames": {
+                            language: (
+                                itemName
+                                if language == "EN-US"
+                                else f"{itemName} ({language})"
+                            )
+                            for language in languages
+                        },
+                        "LocalizedDescriptions": None,
+                    }
+                )
+    # Some items have no names in the live list
+    items.append({"Index": str(len(items)), "UniqueName": "UNIQUE_HIDEOUT"})
+    save("items", items)
+
+    # Current prices of each city and quality
+    prices = []
+    for city in cities:
+        for quality in range(1, 6):
+            sellDate = end - DT.timedelta(minutes=rng.randint(0, 3000))
+            buyDate = end - DT.timedelta(minutes=rng.randint(0, 3000))
+            prices.append(
+                {
+                    "item_id": "T4_BAG",
+                    "city": city,
+                    "quality": quality,
+                    "sell_price_min": rng.choice([0, rng.randint(1000, 5000)]),
+                    "sell_price_min_date": sellDate.strftime(timeFormat),
+                    "sell_price_max": 0,
+                    "sell_price_max_date": "0001-01-01T00:00:00",
+                    "buy_price_min": 0,
+                    "buy_price_min_date": "0001-01-01T00:00:00",
+                    "buy_price_max": rng.choice([0, rng.randint(500, 1000)]),
+                    "buy_price_max_date": buyDate.strftime(timeFormat),
+                }
+            )
+    save("prices", prices)
+
+    # Hourly historical prices of each city and quality, with a few outliers
+    charts = []
+    for city in cities:
+        for quality in range(1, 6):
+            timestamps = []
+            pricesAvg = []
+            itemCounts = []
+            for hour in range(7 * 24):
+                # Missing hours, as in the live API
+                if rng.random() < 0.1:
+                    continue
+                timestamp = end - DT.timedelta(hours=7 * 24 - hour)
+                timestamps.append(timestamp.strftime(timeFormat))
+                price = rng.randint(900, 1100)
+                if rng.random() < 0.01:
+                    price *= 100
+                pricesAvg.append(price)
+                itemCounts.append(rng.randint(1, 40))
+            charts.append(
+                {
+                    "location": city,
+                    "item_id": "T4_BAG",
+                    "quality": quality,
+                    "data": {
+                        "timestamps": timestamps,
+                        "prices_avg": pricesAvg,
+                        "item_count": itemCounts,
+                    },
+                }
+            )
+    save("charts", charts)
+
+    # Guild members
+    members = []
+    for i in range(300):
+        gathering = {
+            kind: {"Total": rng.randint(0, 10**7)}
+            for kind in ["Fiber", "Hide", "Ore", "Rock", "Wood"]
+        }
+        gathering["All"] = {"Total": sum(g["Total"] for g in gathering.values())}
+        members.append(
+            {
+                "Name": f"Member{i}",
+                "Id": f"{i:022d}",
+                "GuildName": "Guild",
+                "KillFame": rng.randint(0, 10**8),
+                "DeathFame": rng.randint(0, 10**7),
+                "LifetimeStatistics": {
+                    "PvE": {"Total": rng.randint(0, 10**8)},
+                    "Gathering": gathering,
+                    "Crafting": {"Total": rng.randint(0, 10**7)},
+                    "Timestamp": end.strftime(timeFormat) + ".000000Z",
+                },
+            }
+        )
+    save("members", members)
+
+    # Hourly gold prices
+    gold = []
+    for hour in range(30 * 24):
+        timestamp = end - DT.timedelta(hours=30 * 24 - hour)
+        gold.append(
+            {
+                "price": rng.randint(3000, 4000),
+                "timestamp": timestamp.strftime(timeFormat),
+            }
+        )
+    save("gold", gold)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record or synthesize JSON fixtures for the offline benchmarks."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    recordParser = subparsers.add_parser("record", help="record from the live APIs")
+    recordParser.add_argument("--item", default="T4_BAG")
+    recordParser.add_argument("--guild", default="Pangolin")
+
+    synthesizeParser = subparsers.add_parser(
+        "synthesize", help="write synthetic fixtures, no network needed"
+    )
+    synthesizeParser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.item, args.guild)
+    else:
+        synthesize(args.seed)
+    print(f"Fixtures saved to {fixturesPath}")
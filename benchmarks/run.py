@@ -0,0 +1,349 @@
+"""Offline benchmarks of the price, search and gold hot paths.
+
+- Usage: python -m benchmarks.run [stage ...] [--repeat N] [--save] [--baseline PATH]
+- Runs each stage against the JSON fixtures (see fixtures.py), no Discord needed.
+- Reports first (cold) call time, min and median time, and memory peak of each stage.
+- Compares median time and memory peak against the stored baseline,
+    exits with 1 if any stage is slower (or bigger) than the tolerance allows.
+- --save stores the results as the new baseline.
+
+Stages:
+    - item_index: build the trigram index of the item list.
+    - item_match: match a set of queries (names, IDs, typos) against the index.
+    - match_cache: same queries, repeated, through the catalog's match cache.
+    - locale_match: same queries, against the index of one locale (as set by a guild).
+    - parse_charts: parse the charts API response into per city arrays.
+    - outlier_mask: reject outliers of each city, as in grabHistory.
+    - history_store: store the charts API response, then read it back.
+    - price_embed: build the current prices embed of the prices command.
+    - guild_fames: aggregate guild members' fames, as in search guild.
+    - parse_gold: parse the gold API response.
+    - gold_window: slice windows of days from the stored gold series.
+    - plot_history: plot the 6 cities historical prices (in this process).
+    - plot_gold: plot the gold prices (in this process).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from benchmarks import fixtures
+
+# Stored results to compare against, machine dependent so not committed
+baselinePath = os.path.dirname(os.path.realpath(__file__)) + "/baseline.json"
+
+# Stage name -> (setup function, default number of repeats)
+# Setup functions return the function to be timed
+stages = {}
+
+
+def stage(name, repeat=20):
+    """Register a stage, setup work is not timed."""
+
+    def register(setup):
+        stages[name] = (setup, repeat)
+        return setup
+
+    return register
+
+
+@stage("item_index", repeat=5)
+def setup_item_index():
+    from helpers.itemindex import ItemIndex
+
+    itemData = fixtures.load("items")
+    return lambda: ItemIndex(itemData)
+
+
+def match_queries(itemData):
+    """Returns queries to match: exact names and IDs, typos, lower case, very short."""
+
+    names = [
+        item["LocalizedNames"]["EN-US"]
+        for item in itemData[:: max(1, len(itemData) // 8)]
+        if item.get("LocalizedNames")
+    ]
+    queries = names + [item["UniqueName"] for item in itemData[:4]]
+    queries += [name.lower()[1:] for name in names] + [name[:-2] for name in names]
+    queries += ["t4 bag", "bag", "t8", "x"]
+
+    # Tier, enchantment and quality in the query (see helpers.query)
+    queries += ["T6.2 bag", "elder's broadsword@3", "8.1 cape excellent", "adepts hide"]
+
+    return queries
+
+
+@stage("item_match")
+def setup_item_match():
+    from helpers.itemindex import ItemIndex
+
+    itemIndex = ItemIndex(fixtures.load("items"))
+    queries = match_queries(itemIndex.itemData)
+
+    return lambda: [itemIndex.match(query, 4) for query in queries]
+
+
+@stage("locale_match")
+def setup_locale_match():
+    from helpers.itemindex import ItemIndex
+
+    itemIndex = ItemIndex(fixtures.load("items"), locales=["EN-US"])
+    queries = match_queries(itemIndex.itemData)
+
+    return lambda: [itemIndex.match(query, 4) for query in queries]
+
+
+@stage("match_cache")
+def setup_match_cache():
+    from helpers.catalog import ItemCatalog
+    from helpers.itemindex import ItemIndex
+
+    # Only the first call fills the cache, the timed calls are all hits
+    catalog = ItemCatalog("")
+    catalog.swap(ItemIndex(fixtures.load("items")))
+    queries = match_queries(catalog.itemData)
+
+    return lambda: [catalog.match(query, 4) for query in queries]
+
+
+@stage("parse_charts")
+def setup_parse_charts():
+    from helpers.history import parse_charts
+
+    prices = fixtures.load("charts")
+    return lambda: parse_charts(prices)
+
+
+@stage("outlier_mask")
+def setup_outlier_mask():
+    from helpers.history import parse_charts
+    from helpers.stats import outlier_mask
+
+    timestampsAll, prices_minAll, itemCountsAll = parse_charts(fixtures.load("charts"))
+
+    def reject():
+        masked = []
+        for (i, prices) in enumerate(prices_minAll):
+            mask = outlier_mask(prices)
+            masked.append(
+                (prices[mask], timestampsAll[i][mask], itemCountsAll[i][mask])
+            )
+        return masked
+
+    return reject
+
+
+@stage("history_store", repeat=10)
+def setup_history_store():
+    import datetime as DT
+    from helpers.history import HistoryStore
+
+    prices = fixtures.load("charts")
+    item = prices[0]["item_id"] if prices else "T4_BAG"
+
+    # Keep every point of the fixture, however old it is
+    historyStore = HistoryStore(keepDays=100000)
+    historyStore.path = tempfile.mkdtemp() + "/history.sqlite3"
+    since = DT.datetime(2000, 1, 1)
+
+    def store_and_read():
+        historyStore.store(item, prices, time.time())
+        return asyncio.run(historyStore.series(item, since))
+
+    return store_and_read
+
+
+@stage("price_embed")
+def setup_price_embed():
+    from cogs.fetchprice import price_embed
+
+    data = fixtures.load("prices")
+    itemNames = ["Adept's Bag", "Expert's Bag", "Master's Bag", "Novice's Bag"]
+    itemIDs = ["T4_BAG", "T5_BAG", "T6_BAG", "T2_BAG"]
+    iconURL = "https://render.albiononline.com/v1/item/"
+
+    return lambda: price_embed(itemNames, itemIDs, data, iconURL)
+
+
+@stage("guild_fames")
+def setup_guild_fames():
+    from cogs.search import guild_fames
+
+    data = fixtures.load("members")
+    return lambda: guild_fames(data)
+
+
+@stage("parse_gold")
+def setup_parse_gold():
+    from helpers.gold import parse_gold
+
+    data = fixtures.load("gold")
+    return lambda: parse_gold(data)
+
+
+@stage("plot_history", repeat=5)
+def setup_plot_history():
+    from helpers.history import parse_charts
+    from helpers.render import warm_up, plot_history
+
+    # Same as a render worker
+    warm_up()
+
+    timestampsAll, prices_minAll, itemCountsAll = parse_charts(fixtures.load("charts"))
+    return lambda: plot_history(
+        "T4_BAG", "Adept's Bag", timestampsAll, prices_minAll, itemCountsAll
+    )
+
+
+@stage("gold_window")
+def setup_gold_window():
+    from helpers.gold import GoldSeries, parse_gold
+
+    # Stored series, sliced for the usual windows of the gold command
+    goldSeries = GoldSeries(filename="benchmark-gold.npz")
+    goldSeries.timeStamps, goldSeries.goldPrices = parse_gold(fixtures.load("gold"))
+
+    return lambda: [goldSeries.window(days) for days in (1, 7, 30, 90)]
+
+
+@stage("plot_gold", repeat=5)
+def setup_plot_gold():
+    from helpers.gold import parse_gold
+    from helpers.render import warm_up, plot_gold
+
+    # Same as a render worker
+    warm_up()
+
+    timeStamps, goldPrices = parse_gold(fixtures.load("gold"))
+    return lambda: plot_gold(timeStamps, goldPrices, 30)
+
+
+def measure(function, repeat):
+    """Returns dict of timings (ms) and memory peak (KiB) of function().
+
+    - first: first call, includes lazy imports and caches being filled.
+    - min and median: of repeat calls after the first one.
+    - peak: traced memory peak of one more call (tracemalloc slows it down,
+        so it is not part of the timings).
+    """
+
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "first": first * 1000,
+        "min": min(times) * 1000,
+        "median": statistics.median(times) * 1000,
+        "peak": peak / 1024,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Returns (comparison string, whether result is worse than tolerance allows)."""
+
+    if baseline is None:
+        return "no baseline", False
+
+    timeRatio = result["median"] / baseline["median"] if baseline["median"] else 1
+    peakRatio = result["peak"] / baseline["peak"] if baseline["peak"] else 1
+    worse = timeRatio > 1 + tolerance or peakRatio > 1 + tolerance
+
+    comparison = f"{timeRatio:.2f}x time, {peakRatio:.2f}x memory"
+    if worse:
+        comparison += "  << REGRESSION"
+
+    return comparison, worse
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of the price, search and gold hot paths."
+    )
+    parser.add_argument(
+        "stages", nargs="*", help=f"stages to run (default all): {', '.join(stages)}"
+    )
+    parser.add_argument("--repeat", type=int, help="timed calls of each stage")
+    parser.add_argument(
+        "--save", action="store_true", help="store results as the new baseline"
+    )
+    parser.add_argument("--baseline", default=baselinePath, help="baseline JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed slowdown/growth over the baseline (default 0.2, i.e. 20%%)",
+    )
+    args = parser.parse_args()
+
+    names = args.stages or list(stages)
+    for name in names:
+        if name not in stages:
+            parser.error(f"unknown stage {name}, stages: {', '.join(stages)}")
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["stages"]
+    except FileNotFoundError:
+        baseline = {}
+
+    print(
+        f"{'stage':<15}{'first ms':>10}{'min ms':>10}{'median ms':>11}{'peak KiB':>11}"
+    )
+
+    results = {}
+    regressions = []
+    for name in names:
+        setup, repeat = stages[name]
+        result = measure(setup(), args.repeat or repeat)
+        results[name] = result
+
+        comparison, worse = compare(result, baseline.get(name), args.tolerance)
+        if worse:
+            regressions.append(name)
+
+        print(
+            f"{name:<15}{result['first']:>10.2f}{result['min']:>10.2f}"
+            f"{result['median']:>11.2f}{result['peak']:>11.1f}  {comparison}"
+        )
+
+    if args.save:
+        # Keep baseline of stages that were not run
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "stages": baseline,
+                },
+                f,
+                indent=4,
+            )
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
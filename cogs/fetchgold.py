@@ -1,12 +1,55 @@
 import discord
 from discord.ext import commands
-import urllib.request
-import json
 import datetime as DT
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import configparser
 import os
+import io
+from helpers.http import httpClient
+from helpers.render import renderer, plot_gold
+from helpers.cache import SizedCache
+from helpers.gold import GoldSeries
+from helpers.metrics import timed
+
+
+def gold_embed(timeStamps, goldPrices):
+    """Returns Discord embed of the latest 6 hours gold prices."""
+
+    # Create Discord embed
+    em = discord.Embed(
+        title=":moneybag: Gold Prices for the Past 6 Hours :moneybag:",
+        colour=discord.Colour.gold(),
+    )
+
+    # Extracting latest gold prices and timestamps
+    try:
+        if not len(timeStamps):
+            raise Exception
+
+        # Format data for Discord embed for past 6 hours data
+        embedGoldPriceString = ""
+        embedTimestampString = ""
+
+        for i in range(1, min(7, len(timeStamps) + 1)):
+            embedGoldPriceString += format(goldPrices[-i], ",d") + "\n"
+            embedTimestampString += str(timeStamps[-i].astype(DT.datetime)) + "\n"
+
+        # Add the fields to Discord embed
+        em.add_field(name="Gold Prices", value=embedGoldPriceString, inline=True)
+        em.add_field(name="Time", value=embedTimestampString, inline=True)
+
+    # If data is empty
+    except:
+        nodataString = "NO DATA"
+        em.add_field(
+            name=f"\n{nodataString:-^60}\n",
+            value="There are no gold data.",
+            inline=True,
+        )
+
+    # \u274c is a red X
+    em.set_footer(text="React with \u274c to delete this post.")
+
+    return em
 
 
 class FetchGold(commands.Cog):
@@ -35,6 +78,22 @@ class FetchGold(commands.Cog):
         self.onlyWork = configs["General"].getboolean("onlyWork")
         self.debug = configs["General"].getboolean("debug")
 
+        # Plots and embeds, keyed by days and latest timestamp
+        # So only plotted again once there are new gold prices
+        # Same plot asked at the same time is only plotted once
+        self.plotCache = SizedCache(
+            "gold plots",
+            maxBytes=configs["Cache"].getint("goldPlotCacheKB") * 1000,
+            sizeOf=lambda value: len(value[0]),
+        )
+
+        # Local series of gold prices, only new points are grabbed
+        # Any number of days is sliced from it
+        self.goldSeries = GoldSeries(
+            refreshSeconds=configs["Cache"].getint("goldRefresh"),
+            keepDays=configs["Cache"].getint("goldKeepDays"),
+        )
+
         # API URLs
         self.goldURL = "https://www.albion-online-data.com/api/v2/stats/gold?date="
 
@@ -57,89 +116,48 @@ class FetchGold(commands.Cog):
             numDays = int(days)
         except:
             await ctx.send("Please enter a single number.")
+            return
 
+        # Only the last keepDays days are stored
+        numDays = max(1, min(numDays, self.goldSeries.keepDays))
 
-        # Get date of past numDays
-        today = DT.datetime.utcnow()
-        date = (today - DT.timedelta(days=numDays)).strftime("%m-%d-%Y")
-        fullURL = self.goldURL + date
+        # Find API URL for gold prices since a date (in %m-%d-%Y format)
+        async def fetch(since):
+            fullURL = self.goldURL + since.strftime("%m-%d-%Y")
+            return await httpClient.get_json(fullURL)
 
-        with urllib.request.urlopen(fullURL) as url:
-            data = json.loads(url.read().decode())
+        # Grab new gold prices, then slice past numDays from self.goldSeries
+        # Stored prices are still used if grabbing fails
+        try:
+            await self.goldSeries.update(numDays, fetch)
+        except Exception as e:
+            if not len(self.goldSeries.timeStamps):
+                raise
+            print(e)
 
-        # Create Discord embed
-        em = discord.Embed(
-            title=":moneybag: Gold Prices for the Past 6 Hours :moneybag:",
-            colour=discord.Colour.gold(),
-        )
+        with timed("window"):
+            timeStamps, goldPrices = self.goldSeries.window(numDays)
 
-        # Extracting latest gold prices and timestamps
-        try:
-            if data == []:
-                raise Exception
-
-            # Get data in a list
-            goldPrices = []
-            timeStamps = []
-            for (i, price) in enumerate(data):
-                goldPrices.append(price["price"])
-                timeStamp = DT.datetime.strptime(
-                    price["timestamp"], "%Y-%m-%dT%H:%M:%S"
-                )
-                timeStamps.append(timeStamp)
-
-            # Format data for Discord embed for past 6 hours data
-            embedGoldPriceString = ""
-            embedTimestampString = ""
-
-            for i in range(1, 7):
-                embedGoldPriceString += format(goldPrices[-i], ',d') + "\n"
-                embedTimestampString += str(timeStamps[-i]) + "\n"
-
-            # Add the fields to Discord embed
-            em.add_field(name="Gold Prices", value=embedGoldPriceString, inline=True)
-            em.add_field(name="Time", value=embedTimestampString, inline=True)
-
-        # If data is empty
-        except:
-            nodataString = "NO DATA"
-            em.add_field(
-                name=f"\n{nodataString:-^60}\n",
-                value="There are no gold data.",
-                inline=True,
-            )
-
-        finally:
-            # Plot the data
-            plt.style.use("seaborn")
-            plt.figure(figsize=(9, 5))
-
-            # Settings for date xaxis
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%m/%d/%Y"))
-            plt.gca().xaxis.set_major_locator(mdates.AutoDateLocator())
-
-            plt.plot(timeStamps, goldPrices, ".-", color="goldenrod")
-
-            plt.gcf().autofmt_xdate()
-            plt.title(f"Past {numDays} Days Gold Prices")
-            plt.xlabel("Dates")
-            plt.ylabel("Prices")
-            plt.savefig("goldplot.png", bbox_inches="tight")
-            plt.close("all")
-
-            # \u274c is a red X
-            em.set_footer(text="React with \u274c to delete this post.")
-            plotFile = discord.File("./goldplot.png", filename="goldplot.png")
+        # Plot the data in a worker process, unless already plotted
+        async def plot_and_embed():
+            with timed("render"):
+                plot = await renderer.render(plot_gold, timeStamps, goldPrices, numDays)
+            return plot, gold_embed(timeStamps, goldPrices)
 
+        latest = timeStamps[-1] if len(timeStamps) else None
+        plot, em = await self.plotCache.get((numDays, latest), plot_and_embed)
+
+        # Send plot straight from memory
+        plotFile = discord.File(io.BytesIO(plot), filename="goldplot.png")
+
+        with timed("upload"):
             msg = await ctx.send(embed=em, file=plotFile)
 
-            # Add delete reaction button
-            await msg.add_reaction("\u274c")
+        # Add delete reaction button
+        await msg.add_reaction("\u274c")
 
-            if self.debug:
-                await self.debugChannel.send(
-                    f"{ctx.message.content} | Gold Matched"
-                )
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content} | Gold Matched")
 
     # Error message of gold
     @gold.error
@@ -1,15 +1,174 @@
 import discord
-from discord.ext import commands
-import urllib.request
-import json
+from discord.ext import commands, tasks
 import datetime as DT
-import statistics
-import difflib
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.gridspec as gridspec
 import configparser
 import os
+import io
+import asyncio
+from collections import Counter
+from helpers.catalog import ItemCatalog
+from helpers.locales import GuildLocales
+from helpers.http import httpClient
+from helpers.render import renderer, plot_history
+from helpers.cache import TTLCache
+from helpers.singleflight import SingleFlight
+from helpers.history import HistoryStore, parse_charts
+from helpers.query import parse_query, qualityNames
+from helpers.stats import outlier_mask
+from helpers.metrics import timed, currentCommand
+from helpers.analytics import analytics
+
+
+def price_embed(itemNames, itemIDs, data, iconURL):
+    """Returns Discord embed of current prices of an item.
+
+    - data is the prices API response of itemIDs[0].
+    - Min sell and max buy prices of each city (and quality), with how long ago.
+    - Next 3 closest matches as suggestions, and item icon as thumbnail.
+    """
+
+    # Create Discord embed
+    em = discord.Embed(title=f"Current Prices for:\n**{itemNames[0]} ({itemIDs[0]})**")
+
+    # Extracting locations' timestamps and minimum sell order prices
+    try:
+        if data == []:
+            raise Exception
+
+        timeStringAll = []
+        timeStringAllBuy = []
+        locationStringAll = []
+        sellPriceMinStringAll = []
+        buyPriceMaxStringAll = []
+
+        for (i, indivData) in enumerate(data):
+
+            # Skip if no data for entry
+            if indivData["sell_price_min"] == 0 and indivData["buy_price_max"] == 0:
+                continue
+
+            # Convert timestamp to datetime format
+            # And find how long ago is timestamp in seconds
+            timestamp = DT.datetime.strptime(
+                indivData["sell_price_min_date"], "%Y-%m-%dT%H:%M:%S"
+            )
+            tdelta = DT.datetime.utcnow() - timestamp
+            tdelta = DT.timedelta.total_seconds(tdelta)
+
+            if tdelta >= 94608000:
+                timeString = "NIL"
+            elif tdelta >= 3600:
+                timeString = str(round(tdelta / 3600, 1)) + " hours ago"
+            elif tdelta >= 60:
+                timeString = str(round(tdelta / 60)) + " mins ago"
+            else:
+                timeString = str(round(tdelta)) + " sec ago"
+
+            timeStringAll.append(timeString)
+
+            # Convert timestamp for max buy order price dates
+            timestamp = DT.datetime.strptime(
+                indivData["buy_price_max_date"], "%Y-%m-%dT%H:%M:%S"
+            )
+            tdelta = DT.datetime.utcnow() - timestamp
+            tdelta = DT.timedelta.total_seconds(tdelta)
+
+            if tdelta >= 94608000:
+                timeString = "NIL"
+            elif tdelta >= 3600:
+                timeString = str(round(tdelta / 3600, 1)) + " hours ago"
+            elif tdelta >= 60:
+                timeString = str(round(tdelta / 60)) + " mins ago"
+            else:
+                timeString = str(round(tdelta)) + " sec ago"
+
+            timeStringAllBuy.append(timeString)
+
+            # Put quality beside location
+            try:
+                if indivData["quality"] == 0 or indivData["quality"] == 1:
+                    locationString = indivData["city"]
+                elif indivData["quality"] == 2:
+                    locationString = indivData["city"] + " (Good)"
+                elif indivData["quality"] == 3:
+                    locationString = indivData["city"] + " (Oustanding)"
+                elif indivData["quality"] == 4:
+                    locationString = indivData["city"] + " (Excellent)"
+                elif indivData["quality"] == 5:
+                    locationString = indivData["city"] + " (Masterpiece)"
+            # Quality not given for items without quality
+            except:
+                locationString = indivData["city"]
+
+            locationStringAll.append(locationString)
+
+            # Getting the minimum sell order prices
+            sellPriceMinStringAll.append(indivData["sell_price_min"])
+
+            # Getting the maximum buy order prices
+            buyPriceMaxStringAll.append(indivData["buy_price_max"])
+
+        # Express in embed format
+        # Basically just output list as column
+        embedLocationString = ""
+        embedPriceString = ""
+        embedTimeString = ""
+        embedPriceStringBuy = ""
+        embedTimeStringBuy = ""
+        embedLocationStringBuy = ""
+
+        for (i, locationString) in enumerate(locationStringAll):
+            # Don't output if no data
+            if sellPriceMinStringAll[i] != 0:
+                embedLocationString += locationString + "\n"
+                embedPriceString += format(sellPriceMinStringAll[i], ",d") + "\n"
+                embedTimeString += timeStringAll[i] + "\n"
+
+            if buyPriceMaxStringAll[i] != 0:
+                embedLocationStringBuy += locationString + "\n"
+                embedPriceStringBuy += format(buyPriceMaxStringAll[i], ",d") + "\n"
+                embedTimeStringBuy += timeStringAllBuy[i] + "\n"
+
+        # Only add embeds if there are prices to show
+        if embedPriceString:
+            # Add the fields to Discord embed
+            em.add_field(name="Locations", value=embedLocationString, inline=True)
+            em.add_field(name="Min Sell Price", value=embedPriceString, inline=True)
+            em.add_field(name="Last Updated", value=embedTimeString, inline=True)
+
+        if embedPriceStringBuy:
+            # Add fields for buy orders
+            em.add_field(name="Locations", value=embedLocationStringBuy, inline=True)
+            em.add_field(name="Max Buy Price", value=embedPriceStringBuy, inline=True)
+            em.add_field(name="Last Updated", value=embedTimeStringBuy, inline=True)
+
+    # If data is empty
+    except:
+        nodataString = "NO DATA"
+        em.add_field(
+            name=f"\n{nodataString:-^60}\n",
+            value="There are no data for this item.",
+            inline=True,
+        )
+
+    finally:
+        # Next 3 closest item matches suggestions
+        # Good for people if they don't remember item's name and type wrongly
+        em.add_field(
+            name="Suggestions:",
+            value=f"{itemNames[1]} ({itemIDs[1]})\n{itemNames[2]} ({itemIDs[2]})\n{itemNames[3]} ({itemIDs[3]})",
+            inline=False,
+        )
+
+        # Adding thumbnail
+        iconFullURL = iconURL + itemIDs[0] + ".png"
+
+        em.set_thumbnail(url=iconFullURL)
+
+        # \u274c is a red X
+        em.set_footer(text="React with \u274c to delete this post.")
+
+    return em
 
 
 class FetchPrice(commands.Cog):
@@ -21,15 +180,28 @@ class FetchPrice(commands.Cog):
             Also send plot of 7 days historical prices.
                 - quick (part of prices)
                     Same as prices command but without plots (faster).
+                - Several items separated by ';' are sent in one embed (batch_prices).
+        - locale
+            Show or set the languages items are matched and named in, for this server.
+
+    Tasks:
+        - refreshItems
+            Load item list from disk, and download it again if it has changed.
+        - prewarm
+            Refresh current prices and plots of the most asked items ahead of time.
 
     Functions:
-        - item_match(item)
+        - item_match(item, guild)
             Find closest matching item name/ID of input item.
-            Uses difflib.
-            Returns first 4 closest match.
+            Uses a trigram index (of the guild's locales) to shortlist items, then difflib.
+            Returns first 4 closest match, cached for repeated queries.
+        - fetch_prices(keys)
+            Get current prices of several items in one request.
+        - history_plot(item, itemName, quality)
+            Returns plot of item's historical prices, cached.
         - grabHistory(item)
             Get item's 7 days historical prices for all cities.
-            Plots them out to 'plot.png'.
+            Plots them in a worker process and returns the PNG bytes.
     """
 
     def __init__(self, client):
@@ -50,6 +222,49 @@ class FetchPrice(commands.Cog):
         self.onlyWork = configs["General"].getboolean("onlyWork")
         self.debug = configs["General"].getboolean("debug")
 
+        self.adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
+
+        # Cache of current prices, keyed by item ID and locations
+        self.priceCache = TTLCache(
+            "prices",
+            ttl=configs["Cache"].getint("priceTTL"),
+            staleTTL=configs["Cache"].getint("priceStaleTTL"),
+            maxSize=configs["Cache"].getint("priceCacheSize"),
+        )
+
+        # Max number of items in one price command
+        self.batchLimit = 10
+
+        # Local store of historical prices, only new points are grabbed
+        self.historyStore = HistoryStore(
+            refreshSeconds=configs["Cache"].getint("historyRefresh")
+        )
+
+        # Coalesces identical grabHistory calls in flight
+        # Keyed by item ID, quality and name like plotCache, the title is in name's language
+        self.historyFlights = SingleFlight()
+
+        # Cache of plots, same refresh time as the history store
+        # Outdated plots are still sent (and plotted again in the background) for a while
+        self.plotCache = TTLCache(
+            "history plots",
+            ttl=configs["Cache"].getint("historyRefresh"),
+            staleTTL=configs["Cache"].getint("plotStaleTTL"),
+            maxSize=configs["Cache"].getint("plotCacheSize"),
+        )
+
+        # Number of times each (item ID, quality) was asked for,
+        # and the names (one per language) it was asked for with
+        # Counts decay at every prewarm, so that the top items follow recent demand
+        self.itemRequests = Counter()
+        self.itemNames = {}
+
+        # Top prewarmItems items are refreshed every prewarmMinutes minutes,
+        # with up to prewarmBudget upstream requests each time
+        self.prewarmItems = configs["Prewarm"].getint("items")
+        self.prewarmBudget = configs["Prewarm"].getint("budget")
+        self.prewarmMinutes = configs["Prewarm"].getfloat("minutes")
+
         # API URLs
         self.iconURL = "https://render.albiononline.com/v1/item/"  # + "T4_HIDE_LEVEL1@1.png?count=1&quality=1"
 
@@ -64,12 +279,142 @@ class FetchPrice(commands.Cog):
         # There are also different localization names
         self.itemList = "https://raw.githubusercontent.com/broderickhyman/ao-bin-dumps/master/formatted/items.json"
 
-        # Open list of items
-        try:
-            with urllib.request.urlopen(self.itemList) as url:
-                self.itemData = json.loads(url.read().decode())
-        except Exception as e:
-            print(e)
+        # List of items is kept on local disk, with a trigram index built once
+        # Only a shortlist of items are scored for each search
+        # Matches of recent queries are cached until the item list changes
+        self.catalog = ItemCatalog(
+            self.itemList, matchCacheSize=configs["Cache"].getint("matchCacheSize")
+        )
+
+        # Languages of each guild, items are only matched against those names
+        # Guilds without a setting use every language, named in English
+        self.guildLocales = GuildLocales()
+
+        # Load item list in the background, then refresh it if it has changed
+        self.refreshItems.change_interval(
+            hours=configs["Items"].getfloat("refreshHours")
+        )
+        self.refreshItems.start()
+
+        # Refresh prices and plots of the most asked items ahead of time
+        if self.prewarmItems:
+            self.prewarm.change_interval(minutes=self.prewarmMinutes)
+            self.prewarm.start()
+
+    def cog_unload(self):
+        self.refreshItems.cancel()
+        self.prewarm.cancel()
+        self.historyStore.close()
+
+    @tasks.loop(hours=6)
+    async def refreshItems(self):
+        """Load item list from disk (first run), and download it if it has changed.
+
+        - Indices of the guilds' locales are built again for the new item list.
+        """
+
+        # Loops started by a reload command would otherwise run as that command
+        currentCommand.set("background")
+
+        await self.catalog.update()
+
+        for locales in self.guildLocales.all():
+            await self.catalog.prepare(locales)
+
+    @tasks.loop(minutes=5)
+    async def prewarm(self):
+        """Refresh current prices and plots of the most asked items ahead of time.
+
+        - Top self.prewarmItems items by (decayed) number of requests.
+        - Only prices that would be outdated before the next run are refreshed.
+        - Plots are only plotted again once the history store grabs new points
+            (historyRefresh), plotting sooner would draw the same stored points.
+        - Plots of every name (language) the item was asked for are refreshed.
+        - Prices are grabbed self.batchLimit items per request,
+            each item's plots may take one request (only new points are grabbed).
+        - Stops once self.prewarmBudget requests are used.
+        - Requests are sent as background work (see helpers.scheduler),
+            commands go ahead of them.
+        """
+
+        # Loops started by a reload command would otherwise run as that command
+        currentCommand.set("background")
+
+        if not self.catalog.itemData:
+            return
+
+        budget = self.prewarmBudget
+        interval = self.prewarmMinutes * 60
+        topItems = [
+            key for (key, _) in self.itemRequests.most_common(self.prewarmItems)
+        ]
+
+        # Decay counts, and forget items that are no longer asked for
+        for key in list(self.itemRequests):
+            self.itemRequests[key] *= 0.5
+            if self.itemRequests[key] < 0.1:
+                del self.itemRequests[key]
+                self.itemNames.pop(key, None)
+
+        def outdated(cache, key):
+            age = cache.age(key)
+            return age is None or age + interval >= cache.ttl
+
+        # Current prices, several items per request
+        keys = list(
+            dict.fromkeys(
+                (itemID, self.locationURL)
+                for (itemID, _) in topItems
+                if outdated(self.priceCache, (itemID, self.locationURL))
+            )
+        )
+        for i in range(0, len(keys), self.batchLimit):
+            if budget <= 0:
+                return
+            budget -= 1
+
+            try:
+                fetched = await self.fetch_prices(keys[i : i + self.batchLimit])
+            except Exception as e:
+                print(e)
+                continue
+            for (key, value) in fetched.items():
+                self.priceCache.put(key, value)
+
+        def plot_outdated(key):
+            age = self.plotCache.age(key)
+            return age is None or age >= self.historyStore.refreshSeconds
+
+        # Plots, at most one request per item
+        # Names after the first one are plotted from the points stored by the first
+        for (itemID, quality) in topItems:
+            names = [
+                itemName
+                for itemName in sorted(self.itemNames.get((itemID, quality), ()))
+                if plot_outdated((itemID, quality, itemName))
+            ]
+            if not names:
+                continue
+            if budget <= 0:
+                return
+            budget -= 1
+
+            for itemName in names:
+                try:
+                    plot = await self.historyFlights.do(
+                        (itemID, quality, itemName),
+                        lambda: self.grabHistory(itemID, itemName, quality),
+                    )
+                except Exception as e:
+                    print(e)
+                    continue
+                if plot is not None:
+                    self.plotCache.put((itemID, quality, itemName), plot)
+
+    @prewarm.before_loop
+    async def before_prewarm(self):
+        # Nothing is asked for yet, and the item list is still loading
+        await asyncio.sleep(self.prewarmMinutes * 60)
 
     @commands.command(
         aliases=["price", "quick",]
@@ -79,9 +424,12 @@ class FetchPrice(commands.Cog):
 
         - Usage: <commandPrefix> price <item name>
         - Item name can also be its ID
-        - Uses difflib for item name recognition.
+        - Several items can be separated by ';', see batch_prices.
+        - Uses trigram index and difflib for item name recognition.
+        - Current prices are cached for a while (see [Cache] in config.ini).
         - Outputs as Discord Embed with thumbnail.
         - Plots 7 days historical prices.
+        - Stages are timed (see helpers.metrics).
         """
 
         # Get command (price or quick)
@@ -98,188 +446,163 @@ class FetchPrice(commands.Cog):
 
         await ctx.channel.trigger_typing()
 
-        # difflib for input search
-        itemNames, itemIDs = self.item_match(item)
+        # Wait for item list if bot has just started
+        if not await self.catalog.wait_ready(30):
+            await ctx.send("Item list is not loaded yet, please try again later.")
+            return
+
+        # Several items, e.g. 't4 bag; t5 bag; t6 bag'
+        # Empty items are dropped, e.g. 't4 bag;' is one item (with its plot)
+        items = [query.strip() for query in item.split(";") if query.strip()]
+        if not items:
+            await ctx.send("Please specify item.")
+            return
+        if len(items) > 1:
+            await self.batch_prices(ctx, items)
+            return
+        item = items[0]
+
+        # Trigram index and difflib for input search
+        # Quality in the query (e.g. 't6 bag excellent') picks the plotted quality
+        with timed("match"):
+            itemNames, itemIDs = await self.item_match(item, ctx.guild)
+            quality = parse_query(item)[3] or 1
+
+        # quick command only sends current prices, without plot
+        quick = any(["quick" in c.lower() for c in command[:2]])
+
+        # Count requests of each item, the most asked ones are kept warm (see prewarm)
+        # quick requests do not count, prewarm would grab plots nobody sees
+        if not quick:
+            self.itemRequests[(itemIDs[0], quality)] += 1
+            self.itemNames.setdefault((itemIDs[0], quality), set()).add(itemNames[0])
 
         # Grab prices from full URL
+        # Served from self.priceCache if item was asked for recently
         fullURL = self.apiURL + itemIDs[0] + self.locationURL
-        with urllib.request.urlopen(fullURL) as url:
-            data = json.loads(url.read().decode())
+        with timed("prices"):
+            data = await self.priceCache.get(
+                (itemIDs[0], self.locationURL), lambda: httpClient.get_json(fullURL)
+            )
 
         # Create Discord embed
-        em = discord.Embed(
-            title=f"Current Prices for:\n**{itemNames[0]} ({itemIDs[0]})**"
-        )
+        with timed("embed"):
+            em = price_embed(itemNames, itemIDs, data, self.iconURL)
 
-        # Extracting locations' timestamps and minimum sell order prices
         try:
-            if data == []:
+            # Skip plotting if command is quick
+            if quick:
                 raise Exception
 
-            timeStringAll = []
-            timeStringAllBuy = []
-            locationStringAll = []
-            sellPriceMinStringAll = []
-            buyPriceMaxStringAll = []
-
-            for (i, indivData) in enumerate(data):
+            # Trigger typing again so that user know its still loading
+            await ctx.channel.trigger_typing()
 
-                # Skip if no data for entry
-                if indivData["sell_price_min"] == 0 and indivData["buy_price_max"] == 0:
-                    continue
+            # Grab past 7 days historical prices and plot them
+            # Recent plots (and those of the most asked items) are cached
+            with timed("history"):
+                plot = await self.history_plot(itemIDs[0], itemNames[0], quality)
 
-                # Convert timestamp to datetime format
-                # And find how long ago is timestamp in seconds
-                timestamp = DT.datetime.strptime(
-                    indivData["sell_price_min_date"], "%Y-%m-%dT%H:%M:%S"
-                )
-                tdelta = DT.datetime.utcnow() - timestamp
-                tdelta = DT.timedelta.total_seconds(tdelta)
-
-                if tdelta >= 94608000:
-                    timeString = "NIL"
-                elif tdelta >= 3600:
-                    timeString = str(round(tdelta / 3600, 1)) + " hours ago"
-                elif tdelta >= 60:
-                    timeString = str(round(tdelta / 60)) + " mins ago"
-                else:
-                    timeString = str(round(tdelta)) + " sec ago"
-
-                timeStringAll.append(timeString)
-
-                # Convert timestamp for max buy order price dates
-                timestamp = DT.datetime.strptime(
-                    indivData["buy_price_max_date"], "%Y-%m-%dT%H:%M:%S"
-                )
-                tdelta = DT.datetime.utcnow() - timestamp
-                tdelta = DT.timedelta.total_seconds(tdelta)
-
-                if tdelta >= 94608000:
-                    timeString = "NIL"
-                elif tdelta >= 3600:
-                    timeString = str(round(tdelta / 3600, 1)) + " hours ago"
-                elif tdelta >= 60:
-                    timeString = str(round(tdelta / 60)) + " mins ago"
-                else:
-                    timeString = str(round(tdelta)) + " sec ago"
-
-                timeStringAllBuy.append(timeString)
-
-                # Put quality beside location
-                try:
-                    if indivData["quality"] == 0 or indivData["quality"] == 1:
-                        locationString = indivData["city"]
-                    elif indivData["quality"] == 2:
-                        locationString = indivData["city"] + " (Good)"
-                    elif indivData["quality"] == 3:
-                        locationString = indivData["city"] + " (Oustanding)"
-                    elif indivData["quality"] == 4:
-                        locationString = indivData["city"] + " (Excellent)"
-                    elif indivData["quality"] == 5:
-                        locationString = indivData["city"] + " (Masterpiece)"
-                # Quality not given for items without quality
-                except:
-                    locationString = indivData["city"]
+            # Send plot straight from memory
+            plotFile = discord.File(io.BytesIO(plot), filename="plot.png")
 
-                locationStringAll.append(locationString)
-
-                # Getting the minimum sell order prices
-                sellPriceMinStringAll.append(indivData["sell_price_min"])
-
-                # Getting the maximum buy order prices
-                buyPriceMaxStringAll.append(indivData["buy_price_max"])
+            # Finally send the embed
+            with timed("upload"):
+                msg = await ctx.send(embed=em, file=plotFile)
 
-            # Express in embed format
-            # Basically just output list as column
-            embedLocationString = ""
-            embedPriceString = ""
-            embedTimeString = ""
-            embedPriceStringBuy = ""
-            embedTimeStringBuy = ""
-            embedLocationStringBuy = ""
-
-            for (i, locationString) in enumerate(locationStringAll):
-                # Don't output if no data
-                if sellPriceMinStringAll[i] != 0:
-                    embedLocationString += locationString + "\n"
-                    embedPriceString += format(sellPriceMinStringAll[i], ',d') + "\n"
-                    embedTimeString += timeStringAll[i] + "\n"
-
-                if buyPriceMaxStringAll[i] != 0:
-                    embedLocationStringBuy += locationString + "\n"
-                    embedPriceStringBuy += format(buyPriceMaxStringAll[i], ',d') + "\n"
-                    embedTimeStringBuy += timeStringAllBuy[i] + "\n"
-
-            # Only add embeds if there are prices to show
-            if embedPriceString:
-                # Add the fields to Discord embed
-                em.add_field(name="Locations", value=embedLocationString, inline=True)
-                em.add_field(name="Min Sell Price", value=embedPriceString, inline=True)
-                em.add_field(name="Last Updated", value=embedTimeString, inline=True)
-
-            if embedPriceStringBuy:
-                # Add fields for buy orders
-                em.add_field(
-                    name="Locations", value=embedLocationStringBuy, inline=True
-                )
-                em.add_field(
-                    name="Max Buy Price", value=embedPriceStringBuy, inline=True
-                )
-                em.add_field(name="Last Updated", value=embedTimeStringBuy, inline=True)
-
-        # If data is empty
+        # Just send embed without plot if command is quick
         except:
-            nodataString = "NO DATA"
-            em.add_field(
-                name=f"\n{nodataString:-^60}\n",
-                value="There are no data for this item.",
-                inline=True,
-            )
+            with timed("upload"):
+                msg = await ctx.send(embed=em)
 
-        finally:
-            # Next 3 closest item matches suggestions
-            # Good for people if they don't remember item's name and type wrongly
-            em.add_field(
-                name="Suggestions:",
-                value=f"{itemNames[1]} ({itemIDs[1]})\n{itemNames[2]} ({itemIDs[2]})\n{itemNames[3]} ({itemIDs[3]})",
-                inline=False,
+        # Add delete reaction button
+        await msg.add_reaction("\u274c")
+
+        if self.debug:
+            await self.debugChannel.send(
+                f"{ctx.message.content} | Matched -> {itemNames[0]} ({itemIDs[0]})"
             )
 
-            # Adding thumbnail
-            iconFullURL = self.iconURL + itemIDs[0] + ".png"
+    async def batch_prices(self, ctx, items):
+        """Send current prices of several items in one embed.
 
-            em.set_thumbnail(url=iconFullURL)
+        - Prices of all items are grabbed in one request (IDs separated by commas).
+        - Each item gets one field, with lowest sell and highest buy price of each city
+            (across all qualities).
+        - Up to self.batchLimit items, no plots.
+        """
 
-            # \u274c is a red X
-            em.set_footer(text="React with \u274c to delete this post.")
+        items = [item.strip() for item in items if item.strip()]
 
-            try:
-                # Skip plotting if command is quick
-                if any(["quick" in c.lower() for c in command[:2]]):
-                    raise Exception
+        # Closest match of each item, without repeats
+        matches = {}
+        with timed("match"):
+            for item in items[: self.batchLimit]:
+                itemNames, itemIDs = await self.item_match(item, ctx.guild)
+                matches.setdefault(itemIDs[0], itemNames[0])
 
-                # Trigger typing again so that user know its still loading
-                await ctx.channel.trigger_typing()
+        # Grab prices of all items not in self.priceCache in one request
+        keys = [(itemID, self.locationURL) for itemID in matches]
+        with timed("prices"):
+            values = await self.priceCache.get_many(keys, self.fetch_prices)
 
-                # Grab past 7 days historical prices and plot them
-                self.grabHistory(itemIDs[0], itemNames[0])
+        # Create Discord embed
+        em = discord.Embed(title="Current Prices (Min Sell / Max Buy):")
+
+        for key in keys:
+            itemID = key[0]
+
+            # Lowest sell and highest buy price of each city
+            sellPrices = {}
+            buyPrices = {}
+            for indivData in values[key]:
+                city = indivData["city"]
+                if indivData["sell_price_min"] != 0:
+                    sellPrices[city] = min(
+                        indivData["sell_price_min"],
+                        sellPrices.get(city, indivData["sell_price_min"]),
+                    )
+                if indivData["buy_price_max"] != 0:
+                    buyPrices[city] = max(
+                        indivData["buy_price_max"], buyPrices.get(city, 0)
+                    )
+
+            # One line for each city
+            embedPriceString = ""
+            for city in sorted(set(sellPrices) | set(buyPrices)):
+                sellPrice = "-"
+                buyPrice = "-"
+                if city in sellPrices:
+                    sellPrice = format(sellPrices[city], ",d")
+                if city in buyPrices:
+                    buyPrice = format(buyPrices[city], ",d")
+                embedPriceString += f"{city}: {sellPrice} / {buyPrice}\n"
+
+            if not embedPriceString:
+                embedPriceString = "There are no data for this item."
 
-                plotFile = discord.File("./plot.png", filename="plot.png")
+            em.add_field(
+                name=f"{matches[itemID]} ({itemID})",
+                value=embedPriceString,
+                inline=False,
+            )
 
-                # Finally send the embed
-                msg = await ctx.send(embed=em, file=plotFile)
+        # \u274c is a red X
+        footer = "React with \u274c to delete this post."
+        if len(items) > self.batchLimit:
+            footer = f"Only the first {self.batchLimit} items are shown.\n" + footer
+        em.set_footer(text=footer)
 
-            # Just send embed without plot if command is quick
-            except:
-                msg = await ctx.send(embed=em)
+        with timed("upload"):
+            msg = await ctx.send(embed=em)
 
-            # Add delete reaction button
-            await msg.add_reaction("\u274c")
+        # Add delete reaction button
+        await msg.add_reaction("\u274c")
 
-            if self.debug:
-                await self.debugChannel.send(
-                    f"{ctx.message.content} | Matched -> {itemNames[0]} ({itemIDs[0]})"
-                )
+        if self.debug:
+            matched = ", ".join(f"{matches[itemID]} ({itemID})" for itemID in matches)
+            await self.debugChannel.send(
+                f"{ctx.message.content} | Matched -> {matched}"
+            )
 
     # Error message of prices
     @prices.error
@@ -287,281 +610,200 @@ class FetchPrice(commands.Cog):
         if isinstance(error, commands.MissingRequiredArgument):
             await ctx.send("Please specify item.")
 
-    def item_match(self, inputWord):
-        """Find closest matching item name and ID of input item.
+    @commands.command(aliases=["language"])
+    async def locale(self, ctx, *locales):
+        """Show or set the locales (languages) items are matched and named in.
 
-        - Matches both item ID (UniqueName) and item name (LocalizedNames)
-        - Uses difflib.
-        - Returns 4 closest match.
+        - Usage: <commandPrefix> locale <locale> <locale> ...
+            e.g. 'locale FR-FR EN-US', items are named in the first locale.
+        - 'locale all' goes back to every locale, named in English.
+        - 'locale' on its own shows the current locales and the available ones.
+        - Only admins and members who can manage the server can change it.
         """
 
-        itemNames = []
-        itemIDs = []
-        jDists = []
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.message.content}")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
 
-        # Read item list
-        data = self.itemData
+        if ctx.guild is None:
+            await ctx.send("Locales can only be set in a server.")
+            return
 
-        # Loop through each item in item.json
-        # Store distance and item index of each item
-        for (i, indivData) in enumerate(data):
+        available = self.catalog.available_locales()
 
-            # Calculate distance for item ID (UniqueName)
-            try:
-                w1 = inputWord.lower()
-                w2 = indivData["UniqueName"].lower()
+        # Show current locales
+        if not locales:
+            current = self.guildLocales.get(ctx.guild.id)
+            await ctx.send(
+                f"Locales: {', '.join(current) if current else 'all'}\n"
+                f"Available: {', '.join(available) or 'item list is not loaded yet'}"
+            )
+            return
 
-                # Use difflib's SequenceMatcher
-                jDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
-                jDists.append([jDist, i])
+        # Checks if admin or server manager
+        if (
+            str(ctx.author) not in self.adminUsers
+            and not ctx.author.guild_permissions.manage_guild
+        ):
+            return
 
-            # If item has no 'UniqueName'
-            except:
-                # Max distance is 1
-                jDists.append([1, i])
+        # 'fr-fr, en-us' and 'FR-FR EN-US' are the same
+        locales = [
+            l.upper() for l in " ".join(locales).replace(",", " ").split() if l
+        ]
+        if locales == ["ALL"]:
+            locales = []
+
+        unknown = [l for l in locales if l not in available]
+        if unknown:
+            await ctx.send(
+                f"Unknown locales: {', '.join(unknown)}\n"
+                f"Available: {', '.join(available) or 'item list is not loaded yet'}"
+            )
+            return
 
-            # Calculate distance for item name (LocalizedNames)
-            try:
-                w1 = inputWord.lower()
+        # Without repeats, in order
+        locales = list(dict.fromkeys(locales))
 
-                # Get distance for all localizations
-                localDists = []
-                for name in indivData["LocalizedNames"]:
-                    w2 = indivData["LocalizedNames"][name].lower()
+        self.guildLocales.set(ctx.guild.id, locales)
+        await self.catalog.prepare(locales)
 
-                    localDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
-                    localDists.append(localDist)
+        await ctx.send(f"Locales: {', '.join(locales) if locales else 'all'}")
 
-                # Pick the closest distance as jDist
-                jDist = min(localDists)
-                jDists.append([jDist, i])
+    async def item_match(self, inputWord, guild=None):
+        """Find closest matching item name and ID of input item.
 
-            # If item has no 'LocalizedNames'
-            except:
-                jDists.append([1, i])
+        - Matches both item ID (UniqueName) and item name (LocalizedNames)
+        - Only names in the guild's locales are matched, and matches are named
+            in its first locale (see locale command).
+        - Shortlists items with the catalog's trigram index, then uses difflib.
+        - Repeated queries (same after lower case and collapsing spaces)
+            are served from the catalog's match cache.
+        - Matched item (or the query, if nothing is close) is counted (helpers.analytics).
+        - Returns 4 closest match.
+        """
 
-        # Sort JDists
-        # Closest match has lowest distance
-        jDists = sorted(jDists)
+        locales = self.guildLocales.get(guild.id if guild else None)
+        await self.catalog.prepare(locales)
 
-        # Get item names and IDs of first 4 closest match
-        itemNames = [data[jDist[1]]["LocalizedNames"]["EN-US"] for jDist in jDists[:4]]
-        itemIDs = [data[jDist[1]]["UniqueName"] for jDist in jDists[:4]]
+        itemNames, itemIDs, distance = self.catalog.match(
+            inputWord, 4, locales, withDistance=True
+        )
+        analytics.record_match(inputWord, itemIDs[0], distance)
 
         return itemNames, itemIDs
 
-    def grabHistory(self, item, itemName):
-        """Grab item's 7 days historical prices for all cities, and plots them.
+    async def fetch_prices(self, keys):
+        """Grab current prices of several items in one request.
 
-        - Grabbed from Data Project API.
-        - Plots timeseries to 'plot.png'.
+        - keys are (item ID, locations URL) tuples, same as self.priceCache.
+        - Returns dict of key -> prices API entries of the item.
         """
 
-        # Outliers makes the plot useless, so we find and remove them
-        # This function is not very effective though
-        def reject_outliers(data):
-            d = [abs(i - statistics.median(data)) for i in data]
-            mdev = statistics.median(d)
-            s = [i / mdev if mdev else 0 for i in d]
-            m = 10
-            indices = [i for (i, val) in enumerate(s) if val < m]
+        fullURL = self.apiURL + ",".join(key[0] for key in keys) + self.locationURL
+        data = await httpClient.get_json(fullURL)
+
+        # Empty response body is None
+        fetched = {key: [] for key in keys}
+        for indivData in data or []:
+            key = (indivData["item_id"], self.locationURL)
+            if key in fetched:
+                fetched[key].append(indivData)
+        return fetched
+
+    async def history_plot(self, item, itemName, quality=1):
+        """Returns plot of item's 7 days historical prices, as PNG bytes.
+
+        - Served from self.plotCache if plotted recently (or by prewarm).
+        - Same item (and name) asked at the same time is only grabbed and plotted once.
+            Different names (languages) share the stored prices, not the plot.
+        - Raises LookupError if there are no historical prices.
+        """
 
-            newData = [data[i] for i in indices]
+        async def grab():
+            plot = await self.historyFlights.do(
+                (item, quality, itemName),
+                lambda: self.grabHistory(item, itemName, quality),
+            )
+            if plot is None:
+                raise LookupError(f"No historical prices of {item}")
+            return plot
+
+        return await self.plotCache.get((item, quality, itemName), grab)
+
+    async def grabHistory(self, item, itemName, quality=1):
+        """Grab item's 7 days historical prices for all cities, and plots them.
 
-            return newData, indices
+        - Grabbed from Data Project API into self.historyStore,
+            only points newer than the stored ones are grabbed.
+        - Plots timeseries from self.historyStore in a worker process.
+        - Only prices of quality are plotted, quality name is added to the title if not Normal.
+        - Returns plot as PNG bytes, or None if there are no stored prices.
+        """
 
-        # Find API URL for past 7 days
+        # Find API URL for prices since a date
         # historyURL requires dates in %m-%d-%Y format
+        # So new prices are grabbed from the start of the day of the last stored price
+        async def fetch(since):
+            date = since.strftime("%m-%d-%Y")
+            fullURL = (
+                self.historyURL
+                + item
+                + "?date="
+                + date
+                + self.historyLocationURL
+                + "&time-scale=1"
+            )
+            return await httpClient.get_json(fullURL)
+
+        # Past 7 days
         today = DT.datetime.utcnow()
         numDays = 7
-        date = (today - DT.timedelta(days=numDays)).strftime("%m-%d-%Y")
-        fullURL = (
-            self.historyURL
-            + item
-            + "?date="
-            + date
-            + self.historyLocationURL
-            + "&time-scale=1"
-        )
-
-        # List will have 10 different indices for 10 different cities
-        # The indices corresponds to this ordering of cities (Alphabetical):
-        # Arthurs, BlackMarket, Bridgewatch, Caerleon, Fort Sterling, Lymhurst, Martlock, Merlyns, Morganas, Thetford
-        prices_minAll = [[], [], [], [], [], [], [], [], [], []]
-        timestampsAll = [[], [], [], [], [], [], [], [], [], []]
-        itemCountsAll = [[], [], [], [], [], [], [], [], [], []]
+        since = today - DT.timedelta(days=numDays)
 
-        # Get price
+        # Grab new prices, then get all prices from self.historyStore
+        # Stored prices are still plotted if grabbing fails
         try:
-            with urllib.request.urlopen(fullURL) as url:
-                prices = json.loads(url.read().decode())
-
+            await self.historyStore.update(item, fetch, since)
         except Exception as e:
             print(e)
+
+        prices = await self.historyStore.series(item, since)
+        if not prices:
             return
 
-        else:
-            for price in prices:
-                if price["quality"] == 1:
-                    if price["location"] == "Arthurs Rest":
-                        prices_minAll[0].extend(price["data"]["prices_avg"])
-                        timestampsAll[0].extend(price["data"]["timestamps"])
-                        itemCountsAll[0].extend(price["data"]["item_count"])
-                    elif price["location"] == "Black Market":
-                        prices_minAll[1].extend(price["data"]["prices_avg"])
-                        timestampsAll[1].extend(price["data"]["timestamps"])
-                        itemCountsAll[1].extend(price["data"]["item_count"])
-                    elif price["location"] == "Bridgewatch":
-                        prices_minAll[2].extend(price["data"]["prices_avg"])
-                        timestampsAll[2].extend(price["data"]["timestamps"])
-                        itemCountsAll[2].extend(price["data"]["item_count"])
-                    elif price["location"] == "Caerleon":
-                        prices_minAll[3].extend(price["data"]["prices_avg"])
-                        timestampsAll[3].extend(price["data"]["timestamps"])
-                        itemCountsAll[3].extend(price["data"]["item_count"])
-                    elif price["location"] == "Fort Sterling":
-                        prices_minAll[4].extend(price["data"]["prices_avg"])
-                        timestampsAll[4].extend(price["data"]["timestamps"])
-                        itemCountsAll[4].extend(price["data"]["item_count"])
-                    elif price["location"] == "Lymhurst":
-                        prices_minAll[5].extend(price["data"]["prices_avg"])
-                        timestampsAll[5].extend(price["data"]["timestamps"])
-                        itemCountsAll[5].extend(price["data"]["item_count"])
-                    elif price["location"] == "Martlock":
-                        prices_minAll[6].extend(price["data"]["prices_avg"])
-                        timestampsAll[6].extend(price["data"]["timestamps"])
-                        itemCountsAll[6].extend(price["data"]["item_count"])
-                    elif price["location"] == "Merlyns Rest":
-                        prices_minAll[7].extend(price["data"]["prices_avg"])
-                        timestampsAll[7].extend(price["data"]["timestamps"])
-                        itemCountsAll[7].extend(price["data"]["item_count"])
-                    elif price["location"] == "Morganas Rest":
-                        prices_minAll[8].extend(price["data"]["prices_avg"])
-                        timestampsAll[8].extend(price["data"]["timestamps"])
-                        itemCountsAll[8].extend(price["data"]["item_count"])
-                    elif price["location"] == "Thetford":
-                        prices_minAll[9].extend(price["data"]["prices_avg"])
-                        timestampsAll[9].extend(price["data"]["timestamps"])
-                        itemCountsAll[9].extend(price["data"]["item_count"])
-
-        # Parse datetime
-        for (i, timestamps) in enumerate(timestampsAll):
-            timestampsAll[i] = [
-                DT.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S")
-                for timestamp in timestamps
-            ]
+        # Lists will have 10 arrays for 10 different cities
+        # The indices corresponds to this ordering of cities (Alphabetical):
+        # Arthurs, BlackMarket, Bridgewatch, Caerleon, Fort Sterling, Lymhurst, Martlock, Merlyns, Morganas, Thetford
+        timestampsAll, prices_minAll, itemCountsAll = parse_charts(prices, quality)
 
+        # Outliers makes the plot useless, so we find and remove them
         # Reject outliers from prices data as well as their corresponding timestamps
         for (i, prices) in enumerate(prices_minAll):
-            try:
-                prices_minAll[i], indices = reject_outliers(prices)
-                timestampsAll[i] = [timestampsAll[i][j] for j in indices]
-                itemCountsAll[i] = [itemCountsAll[i][j] for j in indices]
-            # Pass if prices_minAll = []
-            except:
-                pass
-
-        # Plot labels and plot colors
-        names = [
-            "Arthur's Rest",
-            "Black Market",
-            "Bridgewatch",
-            "Caerleon",
-            "Fort Sterling",
-            "Lymhurst",
-            "Martlock",
-            "Merlyn's Rest",
-            "Morgana's Rest",
-            "Thetford",
-        ]
-        colors = [
-            "red",
-            "rosybrown",
-            "orange",
-            "black",
-            "slategrey",
-            "forestgreen",
-            "blue",
-            "darkturquoise",
-            "purple",
-            "brown",
-        ]
-        plotOrders = [3, 2, 4, 5, 6, 9]
-
-        # Plot the data
-        plt.style.use("seaborn")
-        fig, ax = plt.subplots(
-            nrows=3, ncols=2, figsize=(15, 8.75), sharex=True, sharey=True
-        )
-        ax = ax.flatten()
-
-        fig.suptitle(f"7 Days Sell Order Prices for {itemName} ({item})")
-
-        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
-        plt.subplots_adjust(wspace=0.025, hspace=0.15)
-
-        for j in range(6):
-            # Create gridspec in each subplot
-            gs = gridspec.GridSpecFromSubplotSpec(
-                2, 1, subplot_spec=ax[j], height_ratios=[4, 1], hspace=0.1
-            )
-
-            # First grid is for prices
-            ax0 = plt.subplot(gs[0])
-            # Second grid for item counts
-            if j > 0:
-                ax1 = plt.subplot(gs[1], sharex=ax0, sharey=axPrev)
-            else:
-                ax1 = plt.subplot(gs[1], sharex=ax0)
-
-            # Iterate over all cities and plot each one
-            for (i, timestamp) in enumerate(timestampsAll):
-                try:
-                    # Only plot those that are in plotOrders
-                    if i in plotOrders:
-                        ax0.plot(
-                            timestampsAll[i], prices_minAll[i], color="gray", alpha=0.3,
-                        )
-                # Pass if prices_minAll = []
-                except:
-                    pass
-
-            # Plot the main city
-            ax0.plot(
-                timestampsAll[plotOrders[j]],
-                prices_minAll[plotOrders[j]],
-                color=colors[plotOrders[j]],
+            mask = outlier_mask(prices)
+            prices_minAll[i] = prices[mask]
+            timestampsAll[i] = timestampsAll[i][mask]
+            itemCountsAll[i] = itemCountsAll[i][mask]
+
+        if quality > 1:
+            itemName = f"{itemName} ({qualityNames[quality - 1]})"
+
+        # Plot in a worker process
+        with timed("render"):
+            return await renderer.render(
+                plot_history,
+                item,
+                itemName,
+                timestampsAll,
+                prices_minAll,
+                itemCountsAll,
             )
 
-            # Plot item counts
-            ax1.bar(
-                timestampsAll[plotOrders[j]], itemCountsAll[plotOrders[j]], width=0.04,
-            )
-
-            # Remember item counts axis for sharey
-            if j == 0:
-                axPrev = ax1
-
-            # Only show axis for left and bottom
-            plt.setp(ax0.get_xticklabels(), visible=False)
-            if j % 2:
-                plt.setp(ax0.get_yticklabels(), visible=False)
-                plt.setp(ax1.get_yticklabels(), visible=False)
-            else:
-                ax0.set_ylabel("Silvers")
-                ax1.set_ylabel("Volume")
-            if j not in (4, 5):
-                plt.setp(ax1.get_xticklabels(), visible=False)
-
-            # Title and date axis
-            ax0.set_title(f"{names[plotOrders[j]]}")
-            ax1.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
-
-        fig.savefig("plot.png", bbox_inches="tight")
-        plt.close("all")
-
-        return
-
 
 def setup(client):
     client.add_cog(FetchPrice(client))
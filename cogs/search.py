@@ -1,10 +1,67 @@
 import discord
-from discord.ext import commands
-import urllib.request
-import json
+from discord.ext import commands, tasks
 import datetime as DT
+import asyncio
+import numpy as np
 import configparser
 import os
+from helpers.gameinfo import entityCache
+from helpers.http import httpClient
+from helpers.metrics import timed
+from helpers.scheduler import Busy
+
+
+def guild_fames(data, count=10):
+    """Returns fames of guild members from the guild members API response.
+
+    - Returns (topMembers, topFames, fameTotals).
+    - topMembers and their total fames are the count members with the most fame,
+        sorted by descending fame.
+    - fameTotals has guild total "pvp", "pve", "gathering", "crafting" and "total" fames.
+    - Fames are summed in one pass over a NumPy array (members x fame types),
+        and only the top members are sorted.
+    """
+
+    members = [member["Name"] for member in data]
+
+    # Columns: pvp, pve, gathering, crafting fames of each member
+    fameTable = np.array(
+        [
+            (
+                member["KillFame"],
+                member["LifetimeStatistics"]["PvE"]["Total"],
+                member["LifetimeStatistics"]["Gathering"]["All"]["Total"],
+                member["LifetimeStatistics"]["Crafting"]["Total"],
+            )
+            for member in data
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+
+    # Each member's fame, and guild total individual fames (sum of member's fame)
+    fames = fameTable.sum(axis=1)
+    (pvpFames, pveFames, gatheringFames, craftingFames) = fameTable.sum(axis=0).tolist()
+    totalFame = int(fames.sum())  # Guild total overall fames
+
+    # Top count members, by descending fame
+    if len(fames) > count:
+        top = np.argpartition(-fames, count)[:count]
+    else:
+        top = np.arange(len(fames))
+    top = top[np.argsort(-fames[top], kind="stable")]
+
+    topMembers = [members[i] for i in top]
+    topFames = fames[top].tolist()
+
+    fameTotals = {
+        "pvp": pvpFames,
+        "pve": pveFames,
+        "gathering": gatheringFames,
+        "crafting": craftingFames,
+        "total": totalFame,
+    }
+
+    return topMembers, topFames, fameTotals
 
 
 class Search(commands.Cog):
@@ -18,6 +75,10 @@ class Search(commands.Cog):
 			Options: player, guild
             Item search is not implemented yet.
             Probably can list recipes.
+
+    Tasks:
+        - flushEntities
+            Save cached names, guilds, alliances and members to /data every few minutes.
     """
 
     def __init__(self, client):
@@ -56,6 +117,46 @@ class Search(commands.Cog):
         # API can provide recipe
         self.itemURL = "https://gameinfo.albiononline.com/api/gameinfo/items/"  # + item name + /data
 
+        # Names, alliances, guilds and members are cached (see helpers.gameinfo)
+        entityCache.configure(
+            ttls={
+                "names": configs["Cache"].getint("nameTTL"),
+                "alliances": configs["Cache"].getint("allianceTTL"),
+                "guilds": configs["Cache"].getint("guildTTL"),
+                "members": configs["Cache"].getint("membersTTL"),
+            },
+            maxSize=configs["Cache"].getint("gameinfoCacheSize"),
+        )
+        self.flushEntities.start()
+
+    def cog_unload(self):
+        self.flushEntities.cancel()
+        entityCache.flush()
+
+    @tasks.loop(minutes=10)
+    async def flushEntities(self):
+        """Save cached gameinfo entities to /data, if they changed."""
+
+        try:
+            entityCache.flush()
+        except Exception as e:
+            print(e)
+
+    async def search_id(self, kind, name):
+        """Returns ID of the first player/guild found by the search API.
+
+        - kind is "players" or "guilds".
+        - Cached by name (see helpers.gameinfo), raises IndexError if none found.
+        """
+
+        async def search():
+            # URL spaces are replaced with '%20'
+            data = await httpClient.get_json(self.searchURL + name.replace(" ", "%20"))
+            return data[kind][0]["Id"]
+
+        key = f"{kind}:{' '.join(name.lower().split())}"
+        return await entityCache.get("names", key, search)
+
     @commands.command()
     async def search(self, ctx, option, *, name):
         """Search and retrieve details for players and guilds."""
@@ -71,22 +172,14 @@ class Search(commands.Cog):
 
         await ctx.channel.trigger_typing()
 
-        # URL spaces are replaced with '%20'
-        name = name.replace(" ", "%20")
-
-        # Search for player/guild ID using search API
-        fullURL = self.searchURL + name
-        with urllib.request.urlopen(fullURL) as url:
-            data = json.loads(url.read().decode())
-
         try:
             # Player
             if option.lower() == "player" or option.lower() == "players":
 
-                # Get from player API using player's ID
-                fullURL = self.playerURL + data["players"][0]["Id"]
-                with urllib.request.urlopen(fullURL) as url:
-                    data = json.loads(url.read().decode())
+                # Search for player's ID, then get from player API using it
+                playerID = await self.search_id("players", name)
+                fullURL = self.playerURL + playerID
+                data = await httpClient.get_json(fullURL)
 
                 # Get player details
                 name = data["Name"]
@@ -153,7 +246,8 @@ class Search(commands.Cog):
 
                 em.set_footer(text="React with \u274c to delete this post.")
 
-                msg = await ctx.send(embed=em)
+                with timed("upload"):
+                    msg = await ctx.send(embed=em)
                 await msg.add_reaction("\u274c")  # Delete reaction button
 
                 # Debug message
@@ -165,15 +259,50 @@ class Search(commands.Cog):
             # Guild
             elif option.lower() == "guild" or option.lower() == "guilds":
 
-                # Get from guild API using guild's ID
-                guildID = data["guilds"][0]["Id"]
-                fullURL = self.guildURL + guildID
-                with urllib.request.urlopen(fullURL) as url:
-                    data = json.loads(url.read().decode())
+                # Search for guild's ID, then get from guild API using it
+                guildID = await self.search_id("guilds", name)
+
+                async def alliance_tag(allianceID):
+                    data = await httpClient.get_json(self.allianceURL + allianceID)
+                    return data["AllianceTag"]
+
+                async def guild_and_alliance():
+                    """Returns guild details, and alliance tag (None if no alliance)."""
+
+                    guildData = await entityCache.get(
+                        "guilds",
+                        guildID,
+                        lambda: httpClient.get_json(self.guildURL + guildID),
+                    )
+
+                    # If allianceID exists, get alliance tag from alliance API
+                    allianceID = guildData["AllianceId"]
+                    if allianceID == "" or allianceID == None:
+                        return guildData, None
+                    alliance = await entityCache.get(
+                        "alliances", allianceID, lambda: alliance_tag(allianceID)
+                    )
+                    return guildData, alliance
+
+                async def member_fames():
+                    """Returns top 10 members by descending fame, and guild total fames."""
+
+                    members = await httpClient.get_json(
+                        self.guildURL + guildID + "/members"
+                    )
+                    with timed("aggregate"):
+                        return guild_fames(members, 10)
+
+                # Guild members only need guild's ID,
+                # so they are fetched alongside guild details (and then alliance)
+                # Only the fames are cached, not the whole members list
+                ((data, alliance), fames) = await asyncio.gather(
+                    guild_and_alliance(),
+                    entityCache.get("members", guildID, member_fames),
+                )
 
                 # Get guild details
                 guild = data["Name"]
-                allianceID = data["AllianceId"]
                 founder = data["FounderName"]
                 foundedOn = data["Founded"]
                 foundedOn = DT.datetime.strptime(foundedOn, "%Y-%m-%dT%H:%M:%S.%fZ")
@@ -181,53 +310,13 @@ class Search(commands.Cog):
                 pvp = data["killFame"]
                 memberCount = data["MemberCount"]
 
-                # Set alliance based on allianceID
-                # If allianceID exists, set alliance as alliance tag
-                if allianceID == "" or allianceID == None:
-                    alliance = None
-                else:
-                    fullURL = self.allianceURL + allianceID
-                    with urllib.request.urlopen(fullURL) as url:
-                        data = json.loads(url.read().decode())
-                    alliance = data["AllianceTag"]
-
-                # Get guild members list
-                fullURL = self.guildURL + guildID + "/members"
-                with urllib.request.urlopen(fullURL) as url:
-                    data = json.loads(url.read().decode())
-
-                # Get guild fame details
-                members = []
-                fames = []
-                pvpFames = 0
-                pveFames = 0
-                gatheringFames = 0
-                craftingFames = 0
-                for (i, member) in enumerate(data):
-                    members.append(member["Name"])
-                    pvpFame = member["KillFame"]
-                    pveFame = member["LifetimeStatistics"]["PvE"]["Total"]
-                    gatheringFame = member["LifetimeStatistics"]["Gathering"]["All"][
-                        "Total"
-                    ]
-                    craftingFame = member["LifetimeStatistics"]["Crafting"]["Total"]
-
-                    # Each member's fame
-                    fames.append(pvpFame + pveFame + gatheringFame + craftingFame)
-
-                    # Guild total individual fames (sum of member's fame)
-                    pvpFames += pvpFame
-                    pveFames += pveFame
-                    gatheringFames += gatheringFame
-                    craftingFames += craftingFame
-
-                totalFame = sum(fames)  # Guild total overall fames
-
-                # Sort members based on descending fame
-                sortedMembers = [
-                    x for _, x in sorted(zip(fames, members), reverse=True)
-                ]
-                sortedFames = sorted(fames, reverse=True)
+                # Get guild fame details, top 10 members sorted by descending fame
+                (sortedMembers, sortedFames, fameTotals) = fames
+                pvpFames = fameTotals["pvp"]
+                pveFames = fameTotals["pve"]
+                gatheringFames = fameTotals["gathering"]
+                craftingFames = fameTotals["crafting"]
+                totalFame = fameTotals["total"]
 
                 # Display only 10 members max
                 if len(sortedMembers) > 10:
@@ -279,7 +368,8 @@ class Search(commands.Cog):
 
                 em.set_footer(text="React with \u274c to delete this post.")
 
-                msg = await ctx.send(embed=em)
+                with timed("upload"):
+                    msg = await ctx.send(embed=em)
                 await msg.add_reaction("\u274c")  # Delete reaction button
 
                 # Debug message
@@ -299,6 +389,10 @@ class Search(commands.Cog):
                         f"{ctx.message.content} | Invalid option."
                     )
 
+        # Upstream busy, user is asked to retry later (see on_command_error in main.py)
+        except Busy:
+            raise
+
         except:
             await ctx.send(f"{option} {name} not found.")
 
@@ -1,7 +1,12 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import configparser
 import os
+import datetime as DT
+from helpers.cache import caches
+from helpers.http import httpClient
+from helpers.metrics import summary
+from helpers.analytics import analytics
 
 
 class Utils(commands.Cog):
@@ -24,11 +29,22 @@ class Utils(commands.Cog):
     Commands:
         - ping
             Return latency.
+        - cache
+            Return hit/miss counters of caches.
+        - stats
+            Return latency summary of commands, stages and upstream endpoints,
+            and request queues of upstream hosts.
+        - analytics
+            Return top items, unmatched queries, commands and busiest servers.
         - exec
             Execute Python codes with exec function.
         - eval
             Eval Python values with eval function.
 
+    Tasks:
+        - flushAnalytics
+            Save analytics counters to /data every few minutes.
+
     Listens:
         - Delete reaction button (on_raw_reaction_add)
             Deletes a bot message when reacted with '\u274c' (red X).
@@ -54,6 +70,25 @@ class Utils(commands.Cog):
 
         self.adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
 
+        # Save analytics counters every flushMinutes minutes
+        self.flushAnalytics.change_interval(
+            minutes=configs["Analytics"].getfloat("flushMinutes")
+        )
+        self.flushAnalytics.start()
+
+    def cog_unload(self):
+        self.flushAnalytics.cancel()
+        analytics.flush()
+
+    @tasks.loop(minutes=10)
+    async def flushAnalytics(self):
+        """Save analytics counters to /data, if they changed."""
+
+        try:
+            analytics.flush()
+        except Exception as e:
+            print(e)
+
     @commands.command()
     async def ping(self, ctx):
         """Returns latency of bot."""
@@ -73,6 +108,107 @@ class Utils(commands.Cog):
 
         await ctx.send(f"Pong! {round(self.client.latency * 1000)}ms")
 
+    @commands.command(aliases=["caches"])
+    async def cache(self, ctx):
+        """Returns hit/miss counters of all caches."""
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.author} -> cache")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        # Checks if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        if not caches:
+            await ctx.send("No caches.")
+            return
+
+        stats = "\n".join(cache.stats() for cache in caches.values())
+        await ctx.send(f"```{stats}```")
+
+    @commands.command()
+    async def stats(self, ctx):
+        """Returns latency summary of commands, stages, upstream endpoints and caches.
+
+        - Count, mean and estimated p50/p95 latency (see helpers.metrics).
+        - Sent, turned away (busy) and waiting requests of each host (see helpers.scheduler).
+        - Full histograms are served on the metrics endpoint ([Metrics] in config.ini).
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.author} -> stats")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        # Checks if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        # Discord messages are limited to 2000 characters
+        stats = summary()
+        stats += "\nUpstream queues:"
+        for scheduler in httpClient.scheduler.hosts.values():
+            stats += f"\n  {scheduler.stats()}"
+        if len(stats) > 1990:
+            stats = stats[:1980] + "\n..."
+
+        await ctx.send(f"```{stats}```")
+
+    @commands.command(name="analytics", aliases=["top"])
+    async def analytics_report(self, ctx, count: int = 10):
+        """Returns the most asked items, unmatched queries, commands and servers.
+
+        - Usage: <commandPrefix> analytics <count>
+        - Counted since the analytics file was first written (see helpers.analytics).
+        """
+
+        # Debug message
+        if self.debug:
+            await self.debugChannel.send(f"{ctx.author} -> analytics")
+
+        # Check if in workChannel
+        if self.onlyWork:
+            if ctx.channel.id not in self.workChannel:
+                return
+
+        # Checks if admin
+        if str(ctx.author) not in self.adminUsers:
+            return
+
+        # Server names instead of IDs, if the bot is still in them
+        def guild_name(guildID):
+            guild = self.client.get_guild(int(guildID)) if guildID.isdigit() else None
+            return guild.name if guild else guildID
+
+        since = DT.datetime.utcfromtimestamp(analytics.since).strftime("%d %b %y")
+        lines = [f"Since {since}"]
+        for (title, category, name) in [
+            ("Items", "items", str),
+            ("Unmatched queries", "unmatched", str),
+            ("Commands", "commands", str),
+            ("Servers", "guilds", guild_name),
+        ]:
+            lines.append(f"{title}:")
+            for (key, keyCount) in analytics.top(category, count):
+                lines.append(f"  {name(key)}: {keyCount:,}")
+
+        # Discord messages are limited to 2000 characters
+        report = "\n".join(lines)
+        if len(report) > 1990:
+            report = report[:1980] + "\n..."
+
+        await ctx.send(f"```{report}```")
+
     @commands.command(aliases=["python"])
     async def exec(self, ctx, *, codes):
         """Execute Python codes with exec function
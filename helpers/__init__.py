@@ -0,0 +1,11 @@
+"""Shared helpers used by the cogs.
+
+- Kept outside of /cogs so that main.py does not try to load them as extensions.
+- Modules in here stay imported across extension reloads,
+    so anything shared between cogs (clients, caches, indices) lives here.
+"""
+
+import os
+
+# Local files (item list, stores) are kept in /data
+dataPath = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + "/data"
@@ -0,0 +1,105 @@
+import json
+import time
+from collections import Counter
+from helpers import dataPath
+from helpers.catalog import write_atomic
+
+
+class Analytics:
+    """Counters of what the bot is asked for, kept on local disk.
+
+    - Counted in memory, written to /data every few minutes (see flush).
+    - Counters are totals since the file was first written, loaded back on start up.
+    - commands: command name -> count.
+    - guilds: guild ID (or 'DM') -> number of commands.
+    - items: matched item ID -> count.
+    - unmatched: queries whose closest item is too far off (distance over maxDistance).
+    - Only the keep most common keys of each counter are written,
+        so the file (and memory after a load) stays small.
+
+    Functions:
+        - configure(keep, maxDistance)
+            Set how many keys are kept and when a query counts as unmatched.
+        - record_command(ctx)
+            Count a command and its guild.
+        - record_match(query, itemID, distance)
+            Count a matched item, or an unmatched query.
+        - top(category, count)
+            Returns the count most common keys of a counter.
+        - flush()
+            Write counters to disk if they changed.
+    """
+
+    categories = ["commands", "guilds", "items", "unmatched"]
+
+    def __init__(self, filename="analytics.json", keep=1000, maxDistance=0.5):
+        self.path = f"{dataPath}/{filename}"
+        self.keep = keep
+        self.maxDistance = maxDistance
+
+        self.counters = {category: Counter() for category in self.categories}
+        self.since = time.time()
+        self.changed = False
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            for category in self.categories:
+                self.counters[category].update(saved.get(category, {}))
+            self.since = saved.get("since", self.since)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(e)
+
+    def configure(self, keep, maxDistance):
+        """Set number of keys kept in each counter, and max distance of a match."""
+
+        self.keep = keep
+        self.maxDistance = maxDistance
+
+    def record_command(self, ctx):
+        """Count ctx's command, and its guild."""
+
+        self.counters["commands"][ctx.command.qualified_name] += 1
+        self.counters["guilds"][str(ctx.guild.id) if ctx.guild else "DM"] += 1
+        self.changed = True
+
+    def record_match(self, query, itemID, distance):
+        """Count the matched item, or the query if its closest item is too far off."""
+
+        if distance > self.maxDistance:
+            self.counters["unmatched"][" ".join(query.lower().split())] += 1
+        else:
+            self.counters["items"][itemID] += 1
+        self.changed = True
+
+    def top(self, category, count=10):
+        """Returns [(key, count)] of the count most common keys of category."""
+
+        return self.counters[category].most_common(count)
+
+    def flush(self):
+        """Write counters to disk, only the keep most common keys of each.
+
+        - Does nothing if nothing was counted since the last flush.
+        """
+
+        if not self.changed:
+            return
+
+        saved = {"since": self.since}
+        for category in self.categories:
+            counter = self.counters[category]
+            if len(counter) > self.keep:
+                self.counters[category] = counter = Counter(
+                    dict(counter.most_common(self.keep))
+                )
+            saved[category] = dict(counter)
+
+        write_atomic(self.path, json.dumps(saved).encode())
+        self.changed = False
+
+
+# Shared by all cogs, survives extension reloads
+analytics = Analytics()
@@ -0,0 +1,338 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict
+from helpers.singleflight import SingleFlight
+
+# All caches by name, so that admins can check their hit/miss counters
+caches = {}
+
+
+def spawn_background(coroutine):
+    """Returns a task running coroutine in a new, empty context.
+
+    - Tasks copy the context they are created in, so a refresh spawned by a command
+        would be counted as that command (see helpers.metrics.currentCommand),
+        and sent ahead of other background work (see helpers.scheduler).
+    """
+
+    return contextvars.Context().run(asyncio.ensure_future, coroutine)
+
+
+class TTLCache:
+    """Bounded in-memory cache with TTL and stale-while-revalidate.
+
+    - Entries are fresh for ttl seconds.
+    - Stale entries (older than ttl) are still returned for up to staleTTL seconds,
+        while they are refreshed in the background (see spawn_background).
+    - Entries older than staleTTL are fetched again, like a miss.
+    - Least recently used entries are evicted past maxSize entries.
+    - Registered in caches under name.
+
+    Functions:
+        - get(key, fetch)
+            Returns cached value of key, fetch is awaited to get the value if needed.
+        - get_many(keys, fetchMany)
+            Returns cached values of keys, missing keys are fetched together.
+        - put(key, value)
+            Store value of key, e.g. fetched ahead of time.
+        - age(key)
+            Returns seconds since key was stored, or None.
+        - stats()
+            Returns hit/miss counters as a string.
+    """
+
+    def __init__(self, name, ttl, staleTTL, maxSize):
+        self.name = name
+        self.ttl = ttl
+        self.staleTTL = staleTTL
+        self.maxSize = maxSize
+
+        # key -> (value, time stored)
+        self.entries = OrderedDict()
+        self.refreshing = {}
+
+        self.hits = 0
+        self.staleHits = 0
+        self.misses = 0
+
+        caches[name] = self
+
+    def put(self, key, value):
+        """Store value of key and evict least recently used entries."""
+
+        self.entries[key] = (value, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def age(self, key):
+        """Returns seconds since key was stored, or None if not cached."""
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        return time.monotonic() - entry[1]
+
+    async def get(self, key, fetch):
+        """Returns cached value of key.
+
+        - fetch is a function returning an awaitable of the value.
+        - Fresh entry: returned as it is.
+        - Stale entry: returned as it is, and refreshed in the background.
+        - No entry, or too old: fetch is awaited and its value stored.
+        """
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            (value, storedAt) = entry
+            age = time.monotonic() - storedAt
+
+            if age < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+
+            if age < self.staleTTL:
+                self.staleHits += 1
+                self.entries.move_to_end(key)
+                if key not in self.refreshing:
+                    self.refreshing[key] = spawn_background(self.refresh(key, fetch))
+                return value
+
+        self.misses += 1
+        value = await fetch()
+        self.put(key, value)
+
+        return value
+
+    async def get_many(self, keys, fetchMany):
+        """Returns dict of cached values of keys, same rules as get.
+
+        - fetchMany is a function taking a list of keys,
+            returning an awaitable of a dict of key -> value.
+        - All missing keys are fetched together, in one call of fetchMany.
+        - All stale keys are refreshed together, in one background call.
+        """
+
+        values = {}
+        staleKeys = []
+        missingKeys = []
+
+        now = time.monotonic()
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is not None:
+                (value, storedAt) = entry
+                age = now - storedAt
+
+                if age < self.ttl:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    values[key] = value
+                    continue
+
+                if age < self.staleTTL:
+                    self.staleHits += 1
+                    self.entries.move_to_end(key)
+                    values[key] = value
+                    if key not in self.refreshing:
+                        staleKeys.append(key)
+                    continue
+
+            self.misses += 1
+            missingKeys.append(key)
+
+        if staleKeys:
+            task = spawn_background(self.refresh_many(staleKeys, fetchMany))
+            for key in staleKeys:
+                self.refreshing[key] = task
+
+        if missingKeys:
+            fetched = await fetchMany(missingKeys)
+            for key in missingKeys:
+                self.put(key, fetched[key])
+                values[key] = fetched[key]
+
+        return values
+
+    async def refresh_many(self, keys, fetchMany):
+        """Fetch and store values of keys in the background, in one call."""
+
+        try:
+            fetched = await fetchMany(keys)
+            for key in keys:
+                self.put(key, fetched[key])
+        # Keep serving the stale entries if refresh fails
+        except Exception as e:
+            print(e)
+        finally:
+            for key in keys:
+                self.refreshing.pop(key, None)
+
+    async def refresh(self, key, fetch):
+        """Fetch and store value of key in the background."""
+
+        try:
+            self.put(key, await fetch())
+        # Keep serving the stale entry if refresh fails
+        except Exception as e:
+            print(e)
+        finally:
+            self.refreshing.pop(key, None)
+
+    def stats(self):
+        """Returns hit/miss counters as a string."""
+
+        total = self.hits + self.staleHits + self.misses
+        hitRate = (self.hits + self.staleHits) / total * 100 if total else 0
+
+        return (
+            f"{self.name}: {len(self.entries)}/{self.maxSize} entries, "
+            f"{self.hits:,} hits, {self.staleHits:,} stale hits, "
+            f"{self.misses:,} misses ({hitRate:.1f}% hit rate)"
+        )
+
+
+class LRUCache:
+    """Bounded in-memory LRU cache, for values computed without awaiting.
+
+    - Entries never expire, call clear() when what they were computed from changes.
+    - Least recently used entries are evicted past maxSize entries.
+    - Registered in caches under name, same counters as TTLCache.
+
+    Functions:
+        - get(key, compute)
+            Returns cached value of key, compute() is called to get the value if needed.
+        - clear()
+            Remove all entries.
+        - stats()
+            Returns hit/miss counters as a string.
+    """
+
+    def __init__(self, name, maxSize):
+        self.name = name
+        self.maxSize = maxSize
+
+        # key -> value
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        # Entries are never stale, kept for the same counters as TTLCache
+        self.staleHits = 0
+        self.misses = 0
+
+        caches[name] = self
+
+    def get(self, key, compute):
+        """Returns cached value of key, or the value of compute() stored under key."""
+
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self.entries[key] = compute()
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+            return value
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        """Remove all entries, counters are kept."""
+
+        self.entries.clear()
+
+    def stats(self):
+        """Returns hit/miss counters as a string."""
+
+        total = self.hits + self.misses
+        hitRate = self.hits / total * 100 if total else 0
+
+        return (
+            f"{self.name}: {len(self.entries)}/{self.maxSize} entries, "
+            f"{self.hits:,} hits, {self.misses:,} misses ({hitRate:.1f}% hit rate)"
+        )
+
+
+class SizedCache:
+    """Bounded in-memory LRU cache, bounded by total size in bytes.
+
+    - For large awaited values, e.g. rendered plots.
+    - Entries never expire, keys should change when what the value is made from
+        changes (e.g. include the latest timestamp of the data).
+    - sizeOf(value) returns the size of a value in bytes.
+    - Least recently used entries are evicted past maxBytes in total.
+    - Concurrent gets of the same missing key share one fetch.
+    - Registered in caches under name, same counters as TTLCache.
+
+    Functions:
+        - get(key, fetch)
+            Returns cached value of key, fetch is awaited to get the value if needed.
+        - stats()
+            Returns hit/miss counters as a string.
+    """
+
+    def __init__(self, name, maxBytes, sizeOf=len):
+        self.name = name
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+
+        # key -> (value, size)
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self.flights = SingleFlight()
+
+        self.hits = 0
+        # Entries are never stale, kept for the same counters as TTLCache
+        self.staleHits = 0
+        self.misses = 0
+
+        caches[name] = self
+
+    def put(self, key, value):
+        """Store value of key and evict least recently used entries past maxBytes."""
+
+        if key in self.entries:
+            self.totalBytes -= self.entries.pop(key)[1]
+
+        size = self.sizeOf(value)
+        self.entries[key] = (value, size)
+        self.totalBytes += size
+
+        # Newest entry is kept, even if it is larger than maxBytes on its own
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            self.totalBytes -= self.entries.popitem(last=False)[1][1]
+
+    async def get(self, key, fetch):
+        """Returns cached value of key, or the awaited fetch() stored under key."""
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+
+        async def fetch_and_put():
+            value = await fetch()
+            self.put(key, value)
+            return value
+
+        return await self.flights.do(key, fetch_and_put)
+
+    def stats(self):
+        """Returns hit/miss counters and size as a string."""
+
+        total = self.hits + self.misses
+        hitRate = self.hits / total * 100 if total else 0
+
+        return (
+            f"{self.name}: {len(self.entries)} entries, "
+            f"{self.totalBytes / 1e6:.1f}/{self.maxBytes / 1e6:.1f} MB, "
+            f"{self.hits:,} hits, {self.misses:,} misses ({hitRate:.1f}% hit rate)"
+        )
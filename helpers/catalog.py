@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+from helpers import dataPath
+from helpers.cache import LRUCache
+from helpers.http import httpClient
+from helpers.itemindex import ItemIndex
+from helpers.singleflight import SingleFlight
+
+
+def write_atomic(path, data):
+    """Write bytes to path through a temporary file, so path is never half written."""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class ItemCatalog:
+    """Item list (items.json from ao-bin-dumps) kept on local disk.
+
+    - Loaded from disk, no network needed to start up.
+    - Refreshed with a conditional request (ETag/Last-Modified),
+        so the list is only downloaded again when it has changed.
+    - A changed list is saved to disk, and its index swapped in at once.
+    - Loading, parsing and indexing run in a thread, off the event loop.
+    - Matches of recent queries are cached (normalized query -> names and IDs),
+        the cache is cleared whenever a new item list is swapped in.
+    - Indices of only some locales (e.g. a guild's languages) are built on demand,
+        in a thread, and dropped when a new item list is swapped in.
+
+    Functions:
+        - load()
+            Load item list from disk.
+        - refresh()
+            Download item list if it has changed.
+        - update()
+            load() if not loaded yet, then refresh().
+        - wait_ready(timeout)
+            Wait until the first load (or download) is done.
+        - prepare(locales)
+            Build the index of locales, if not built yet.
+        - match(inputWord, count, locales)
+            Returns item names and IDs of the closest matches, cached.
+        - available_locales()
+            Returns locales of the item list.
+    """
+
+    def __init__(self, url, filename="items.json", matchCacheSize=1000):
+        self.url = url
+        self.path = f"{dataPath}/{filename}"
+        self.metaPath = f"{dataPath}/{filename}.meta"
+
+        # Item list and its index, swapped together
+        self.itemIndex = ItemIndex([])
+        self.ready = asyncio.Event()
+
+        # Locales (tuple) -> index of only those locales, of the current item list
+        self.localeIndices = {}
+        self.localeFlights = SingleFlight()
+
+        # Normalized query and count -> (item names, item IDs)
+        self.matchCache = LRUCache("item matches", matchCacheSize)
+
+    @property
+    def itemData(self):
+        return self.itemIndex.itemData
+
+    def swap(self, itemIndex):
+        """Swap in new item index (with its item list), and clear cached matches."""
+
+        self.itemIndex = itemIndex
+        self.localeIndices = {}
+        self.matchCache.clear()
+        self.ready.set()
+
+    async def load(self):
+        """Load item list from disk, if it was saved before."""
+
+        def read():
+            with open(self.path, "rb") as f:
+                return ItemIndex(json.loads(f.read().decode()))
+
+        try:
+            itemIndex = await asyncio.get_running_loop().run_in_executor(None, read)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(e)
+            return
+
+        self.swap(itemIndex)
+
+    async def refresh(self):
+        """Download item list if it has changed since the last download.
+
+        - Sends ETag/Last-Modified of the saved list,
+            server replies with 304 Not Modified if it has not changed.
+        - A new list is saved to disk before it is swapped in.
+        """
+
+        # Conditional headers only make sense if the list is loaded
+        headers = {}
+        if self.itemData:
+            try:
+                with open(self.metaPath) as f:
+                    meta = json.load(f)
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("lastModified"):
+                    headers["If-Modified-Since"] = meta["lastModified"]
+            except Exception:
+                pass
+
+        try:
+            status, responseHeaders, body = await httpClient.get_raw(
+                self.url, headers=headers, timeout=300
+            )
+        except Exception as e:
+            print(e)
+            return
+
+        # Not modified
+        if status == 304:
+            return
+
+        def save():
+            itemIndex = ItemIndex(json.loads(body.decode()))
+            write_atomic(self.path, body)
+            meta = {
+                "etag": responseHeaders.get("ETag"),
+                "lastModified": responseHeaders.get("Last-Modified"),
+            }
+            write_atomic(self.metaPath, json.dumps(meta).encode())
+            return itemIndex
+
+        try:
+            itemIndex = await asyncio.get_running_loop().run_in_executor(None, save)
+        except Exception as e:
+            print(e)
+            return
+
+        self.swap(itemIndex)
+
+    async def update(self):
+        """Load item list from disk if not loaded yet, then refresh it.
+
+        - Marks the catalog ready once done, even if there is no item list,
+            so that commands do not keep waiting for it.
+        """
+
+        if not self.itemData:
+            await self.load()
+
+        await self.refresh()
+        self.ready.set()
+
+    async def wait_ready(self, timeout):
+        """Wait up to timeout seconds for the item list to be loaded.
+
+        - Returns True if the item list is loaded.
+        """
+
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        return bool(self.itemData)
+
+    def available_locales(self):
+        """Returns locales of the item list, e.g. ["EN-US", "DE-DE", ...]."""
+
+        locales = {}
+        for i in self.itemIndex.searchable:
+            locales.update(dict.fromkeys(self.itemData[i]["LocalizedNames"]))
+
+        return list(locales)
+
+    async def prepare(self, locales):
+        """Build the index of only locales (in a thread), if not built yet.
+
+        - Does nothing if locales is None (all locales, the main index).
+        - Index is only kept if the item list was not swapped while building.
+        """
+
+        if not locales or tuple(locales) in self.localeIndices:
+            return
+
+        itemIndex = self.itemIndex
+
+        async def build():
+            localeIndex = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: ItemIndex(itemIndex.itemData, locales=list(locales))
+            )
+            if self.itemIndex is itemIndex:
+                self.localeIndices[tuple(locales)] = localeIndex
+
+        await self.localeFlights.do((id(itemIndex), tuple(locales)), build)
+
+    def match(self, inputWord, count=4, locales=None, withDistance=False):
+        """Returns item names and IDs of the count closest matches of inputWord.
+
+        - Query is normalized (lower case, single spaces) before matching,
+            so e.g. 'T4  Bag' and 't4 bag' share one cached result.
+        - Only names of locales are scored, and matches are named in the first one,
+            if their index is built (see prepare), otherwise all locales are used.
+        - Cached results are returned as new lists, callers may change them.
+        - Also returns distance of the closest match if withDistance (see ItemIndex.resolve).
+        """
+
+        query = " ".join(inputWord.lower().split())
+        itemIndex = self.localeIndices.get(tuple(locales or ()), self.itemIndex)
+        indexLocales = itemIndex.locales and tuple(itemIndex.locales)
+
+        (itemNames, itemIDs, distance) = self.matchCache.get(
+            (query, count, indexLocales),
+            lambda: itemIndex.match(query, count, withDistance=True),
+        )
+
+        if withDistance:
+            return list(itemNames), list(itemIDs), distance
+        return list(itemNames), list(itemIDs)
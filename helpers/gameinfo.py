@@ -0,0 +1,176 @@
+import json
+import time
+from collections import OrderedDict
+from helpers import dataPath
+from helpers.cache import caches
+from helpers.catalog import write_atomic
+from helpers.singleflight import SingleFlight
+
+
+class EntityKind:
+    """Bounded cache of one kind of gameinfo entity, with its own TTL.
+
+    - Entries older than ttl seconds are fetched again, like a miss.
+    - Stored with wall clock times, so entries loaded from disk keep their age.
+    - Least recently used entries are evicted past maxSize entries.
+    - Concurrent gets of the same missing key share one fetch.
+    - Registered in caches under name, same counters as TTLCache.
+
+    Functions:
+        - get(key, fetch)
+            Returns cached value of key, fetch is awaited to get the value if needed.
+        - fresh()
+            Returns {key: [value, time stored]} of unexpired entries.
+        - stats()
+            Returns hit/miss counters as a string.
+    """
+
+    def __init__(self, name, ttl, maxSize):
+        self.name = name
+        self.ttl = ttl
+        self.maxSize = maxSize
+
+        # key -> [value, time stored]
+        self.entries = OrderedDict()
+        self.flights = SingleFlight()
+        self.changed = False
+
+        self.hits = 0
+        # Entries are never served stale, kept for the same counters as TTLCache
+        self.staleHits = 0
+        self.misses = 0
+
+        caches[name] = self
+
+    def put(self, key, value, storedAt=None):
+        """Store value of key and evict least recently used entries."""
+
+        self.entries[key] = [value, storedAt or time.time()]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+        self.changed = True
+
+    async def get(self, key, fetch):
+        """Returns cached value of key, or the awaited fetch() stored under key.
+
+        - fetch is a function returning an awaitable of the value.
+        - Nothing is stored if fetch raises (e.g. name not found).
+        """
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            (value, storedAt) = entry
+            if time.time() - storedAt < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            del self.entries[key]
+
+        self.misses += 1
+
+        async def fetch_and_put():
+            value = await fetch()
+            self.put(key, value)
+            return value
+
+        return await self.flights.do(key, fetch_and_put)
+
+    def fresh(self):
+        """Returns {key: [value, time stored]} of entries younger than ttl."""
+
+        now = time.time()
+        return {
+            key: entry
+            for (key, entry) in self.entries.items()
+            if now - entry[1] < self.ttl
+        }
+
+    def stats(self):
+        """Returns hit/miss counters as a string."""
+
+        total = self.hits + self.misses
+        hitRate = self.hits / total * 100 if total else 0
+
+        return (
+            f"{self.name}: {len(self.entries)}/{self.maxSize} entries, "
+            f"{self.hits:,} hits, {self.misses:,} misses ({hitRate:.1f}% hit rate)"
+        )
+
+
+class EntityCache:
+    """Caches of gameinfo API entities (search player/guild), kept on local disk.
+
+    - One EntityKind for each kind of entity, each with its own TTL:
+        - names: "players:name" or "guilds:name" -> ID, IDs never change.
+        - alliances: alliance ID -> alliance tag, almost never changes.
+        - guilds: guild ID -> guild details.
+        - members: guild ID -> member fames (top members and totals, see cogs.search).
+    - Written to /data every few minutes (see flush), and loaded back on start up,
+        so a restart does not send every search upstream again.
+
+    Functions:
+        - configure(ttls, maxSize)
+            Set TTL of each kind, and number of entries kept of each kind.
+        - get(kind, key, fetch)
+            Returns cached value of key of kind, fetch is awaited if needed.
+        - flush()
+            Write unexpired entries to disk, if any changed.
+    """
+
+    kinds = {
+        "names": 7 * 24 * 3600,
+        "alliances": 24 * 3600,
+        "guilds": 3600,
+        "members": 1800,
+    }
+
+    def __init__(self, filename="gameinfo.json", maxSize=1000):
+        self.path = f"{dataPath}/{filename}"
+        self.caches = {
+            kind: EntityKind(f"gameinfo {kind}", ttl, maxSize)
+            for (kind, ttl) in self.kinds.items()
+        }
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            for (kind, cache) in self.caches.items():
+                for (key, (value, storedAt)) in saved.get(kind, {}).items():
+                    cache.put(key, value, storedAt)
+                cache.changed = False
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(e)
+
+    def configure(self, ttls, maxSize):
+        """Set TTL (seconds) of each kind in ttls, and number of entries of each kind."""
+
+        for (kind, cache) in self.caches.items():
+            cache.ttl = ttls.get(kind, cache.ttl)
+            cache.maxSize = maxSize
+
+    async def get(self, kind, key, fetch):
+        """Returns cached value of key of kind, see EntityKind.get."""
+
+        return await self.caches[kind].get(key, fetch)
+
+    def flush(self):
+        """Write unexpired entries of all kinds to disk.
+
+        - Does nothing if nothing was stored since the last flush.
+        """
+
+        if not any(cache.changed for cache in self.caches.values()):
+            return
+
+        saved = {kind: cache.fresh() for (kind, cache) in self.caches.items()}
+        write_atomic(self.path, json.dumps(saved).encode())
+
+        for cache in self.caches.values():
+            cache.changed = False
+
+
+# Shared by all cogs, survives extension reloads
+entityCache = EntityCache()
@@ -0,0 +1,147 @@
+import asyncio
+import datetime as DT
+import io
+import time
+import numpy as np
+from helpers import dataPath
+from helpers.catalog import write_atomic
+from helpers.singleflight import SingleFlight
+
+
+def parse_gold(data):
+    """Returns (timeStamps, goldPrices) arrays from the gold API response.
+
+    - timeStamps are datetime64[s], parsed by NumPy all at once (no strptime).
+    - goldPrices are int64.
+    """
+
+    timeStamps = np.array([price["timestamp"] for price in data], dtype="datetime64[s]")
+    goldPrices = np.array([price["price"] for price in data], dtype=np.int64)
+
+    return timeStamps, goldPrices
+
+
+class GoldSeries:
+    """Local series of hourly gold prices, kept on disk as NumPy arrays.
+
+    - Timestamps and prices are kept sorted, saved together in one .npz file.
+    - Only points newer than the last stored one are fetched,
+        starting from the day of the last point (the API only takes dates).
+    - Older points are only fetched if a window starts before the stored ones.
+    - Works like a ring buffer, only the last keepDays days are kept.
+    - Not fetched again within refreshSeconds of the last fetch.
+    - Any window of days is then sliced from the stored arrays.
+
+    Functions:
+        - update(days, fetch)
+            Fetch missing points of the past days days.
+        - window(days)
+            Returns stored (timeStamps, goldPrices) of the past days days.
+    """
+
+    def __init__(self, filename="gold.npz", refreshSeconds=600, keepDays=400):
+        self.path = f"{dataPath}/{filename}"
+        self.refreshSeconds = refreshSeconds
+        self.keepDays = keepDays
+
+        self.timeStamps = np.array([], dtype="datetime64[s]")
+        self.goldPrices = np.array([], dtype=np.int64)
+
+        # Earliest day fetched (NaT if none), windows from then on have nothing to fetch
+        self.coveredSince = np.datetime64("NaT", "s")
+        self.fetchedAt = 0
+
+        # Concurrent updates share one fetch
+        self.flights = SingleFlight()
+
+        try:
+            with np.load(self.path) as saved:
+                self.timeStamps = saved["timeStamps"]
+                self.goldPrices = saved["goldPrices"]
+                self.coveredSince = saved["coveredSince"][()].astype("datetime64[s]")
+                self.fetchedAt = float(saved["fetchedAt"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(e)
+
+    def save(self):
+        """Write the arrays to disk, through a temporary file."""
+
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            timeStamps=self.timeStamps,
+            goldPrices=self.goldPrices,
+            coveredSince=self.coveredSince,
+            fetchedAt=self.fetchedAt,
+        )
+        write_atomic(self.path, buffer.getvalue())
+
+    def merge(self, timeStamps, goldPrices, since):
+        """Merge fetched points into the stored ones, and drop points past keepDays.
+
+        - Fetched points replace stored points with the same timestamp.
+        """
+
+        allTimeStamps = np.concatenate([timeStamps, self.timeStamps])
+        allPrices = np.concatenate([goldPrices, self.goldPrices])
+
+        # First of each timestamp is kept, i.e. the fetched one
+        allTimeStamps, indices = np.unique(allTimeStamps, return_index=True)
+        allPrices = allPrices[indices]
+
+        oldest = np.datetime64(
+            DT.datetime.utcnow() - DT.timedelta(days=self.keepDays), "s"
+        )
+        keep = allTimeStamps >= oldest
+        self.timeStamps = allTimeStamps[keep]
+        self.goldPrices = allPrices[keep]
+
+        # API returns points from the start of the day of since
+        since = max(np.datetime64(since, "D").astype("datetime64[s]"), oldest)
+        if np.isnat(self.coveredSince) or since < self.coveredSince:
+            self.coveredSince = since
+
+    async def update(self, days, fetch):
+        """Fetch points of the past days days that are not stored yet.
+
+        - fetch is a function taking a datetime,
+            returning an awaitable of the gold API response from that date.
+        - Fetches from the start of the window if it is older than the stored points,
+            otherwise only from the day of the last stored point.
+        - Skipped if nothing is missing and the last fetch was within refreshSeconds.
+        """
+
+        days = min(days, self.keepDays)
+        start = DT.datetime.utcnow() - DT.timedelta(days=days)
+        missingOld = np.isnat(self.coveredSince) or (
+            np.datetime64(start, "s") < self.coveredSince
+        )
+
+        if not missingOld and time.time() - self.fetchedAt < self.refreshSeconds:
+            return
+
+        if missingOld or not len(self.timeStamps):
+            since = start
+        else:
+            since = self.timeStamps[-1].astype(DT.datetime)
+
+        async def fetch_and_store():
+            fetchedAt = time.time()
+            data = await fetch(since)
+            timeStamps, goldPrices = parse_gold(data or [])
+
+            self.merge(timeStamps, goldPrices, since)
+            self.fetchedAt = fetchedAt
+            await asyncio.get_running_loop().run_in_executor(None, self.save)
+
+        await self.flights.do(since.date(), fetch_and_store)
+
+    def window(self, days):
+        """Returns stored (timeStamps, goldPrices) arrays of the past days days."""
+
+        start = np.datetime64(DT.datetime.utcnow() - DT.timedelta(days=days), "s")
+        i = np.searchsorted(self.timeStamps, start)
+
+        return self.timeStamps[i:], self.goldPrices[i:]
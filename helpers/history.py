@@ -0,0 +1,263 @@
+import asyncio
+import concurrent.futures
+import datetime as DT
+import os
+import sqlite3
+import time
+import numpy as np
+from helpers import dataPath
+
+# Location (as named by the charts API) -> slot in the per city arrays
+# Slots are in alphabetical order, same as the plot names and colors
+locationSlots = {
+    "Arthurs Rest": 0,
+    "Black Market": 1,
+    "Bridgewatch": 2,
+    "Caerleon": 3,
+    "Fort Sterling": 4,
+    "Lymhurst": 5,
+    "Martlock": 6,
+    "Merlyns Rest": 7,
+    "Morganas Rest": 8,
+    "Thetford": 9,
+}
+
+
+def parse_charts(prices, quality=1):
+    """Parse a charts API response into per city NumPy arrays.
+
+    - Returns (timestampsAll, pricesAll, itemCountsAll),
+        each a list with one array per slot in locationSlots.
+    - Timestamps are datetime64, aligned with the prices and item counts.
+    - Only entries of the given quality, and of known locations, are parsed.
+    """
+
+    # Chunks of each slot, concatenated once at the end
+    timestampChunks = [[] for _ in locationSlots]
+    priceChunks = [[] for _ in locationSlots]
+    countChunks = [[] for _ in locationSlots]
+
+    for price in prices:
+        slot = locationSlots.get(price["location"])
+        if price["quality"] != quality or slot is None:
+            continue
+
+        data = price["data"]
+        timestampChunks[slot].append(
+            np.array(data["timestamps"], dtype="datetime64[s]")
+        )
+        priceChunks[slot].append(np.array(data["prices_avg"], dtype=float))
+        countChunks[slot].append(np.array(data["item_count"], dtype=int))
+
+    def concatenate(chunks, dtype):
+        return [np.concatenate(c) if c else np.array([], dtype=dtype) for c in chunks]
+
+    return (
+        concatenate(timestampChunks, "datetime64[s]"),
+        concatenate(priceChunks, float),
+        concatenate(countChunks, int),
+    )
+
+
+class HistoryStore:
+    """Local SQLite store of hourly historical prices.
+
+    - Keyed by item, location, quality and timestamp.
+    - Each update only asks the API for points from the last stored one
+        (the last hour is asked again, as its average changes until the hour is over).
+    - Points that are asked again replace the stored ones.
+    - An item is not updated again within refreshSeconds of its last update.
+    - Points older than keepDays are deleted on every update, of all items,
+        so items that are never asked for again do not stay in the store.
+    - All database work is done in one thread, off the event loop.
+
+    Functions:
+        - update(item, fetch, since)
+            Fetch and store new points of item.
+        - series(item, since)
+            Returns stored points of item in the same format as the charts API.
+        - close()
+            Close the database connection and stop the database thread.
+    """
+
+    def __init__(self, filename="history.sqlite3", refreshSeconds=600, keepDays=8):
+        self.path = f"{dataPath}/{filename}"
+        self.refreshSeconds = refreshSeconds
+        self.keepDays = keepDays
+
+        # One thread, so that the connection is only used by one thread at a time
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.connection = None
+
+    def connect(self):
+        """Returns the database connection, creating the tables if needed."""
+
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    item TEXT,
+                    location TEXT,
+                    quality INTEGER,
+                    timestamp TEXT,
+                    price INTEGER,
+                    count INTEGER,
+                    PRIMARY KEY (item, location, quality, timestamp)
+                );
+                CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+                CREATE TABLE IF NOT EXISTS updates (
+                    item TEXT PRIMARY KEY,
+                    updatedAt REAL
+                );
+                """
+            )
+
+        return self.connection
+
+    def close(self):
+        """Close the database connection in its thread, then stop the thread.
+
+        - Database work already queued is done first.
+        """
+
+        def close_connection():
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+        self.executor.submit(close_connection)
+        self.executor.shutdown(wait=False)
+
+    async def run(self, function, *args):
+        """Run function(*args) in the database thread."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def last_update(self, item):
+        """Returns (time of last update, last stored timestamp) of item."""
+
+        connection = self.connect()
+        row = connection.execute(
+            "SELECT updatedAt FROM updates WHERE item = ?", (item,)
+        ).fetchone()
+        updatedAt = row[0] if row else 0
+
+        row = connection.execute(
+            "SELECT MAX(timestamp) FROM history WHERE item = ?", (item,)
+        ).fetchone()
+
+        return updatedAt, row[0]
+
+    def store(self, item, prices, updatedAt):
+        """Store points of item from a charts API response.
+
+        - Also deletes points older than keepDays of all items,
+            and updates of items not updated since then.
+        """
+
+        rows = []
+        for price in prices:
+            data = price["data"]
+            for (timestamp, priceAvg, itemCount) in zip(
+                data["timestamps"], data["prices_avg"], data["item_count"]
+            ):
+                rows.append(
+                    (
+                        item,
+                        price["location"],
+                        price["quality"],
+                        timestamp,
+                        priceAvg,
+                        itemCount,
+                    )
+                )
+
+        oldest = DT.datetime.utcnow() - DT.timedelta(days=self.keepDays)
+
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            connection.execute(
+                "DELETE FROM history WHERE timestamp < ?",
+                (oldest.strftime("%Y-%m-%dT%H:%M:%S"),),
+            )
+            connection.execute(
+                "DELETE FROM updates WHERE updatedAt < ?",
+                (time.time() - self.keepDays * 86400,),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO updates VALUES (?, ?)", (item, updatedAt)
+            )
+
+    async def update(self, item, fetch, since):
+        """Fetch and store points of item that are newer than the stored ones.
+
+        - fetch is a function taking a datetime,
+            returning an awaitable of the charts API response from that time.
+        - Points from since are fetched if item has no stored points.
+        - Skipped if item was updated within self.refreshSeconds.
+        """
+
+        (updatedAt, lastTimestamp) = await self.run(self.last_update, item)
+        if time.time() - updatedAt < self.refreshSeconds:
+            return
+
+        if lastTimestamp is not None:
+            lastTimestamp = DT.datetime.strptime(lastTimestamp, "%Y-%m-%dT%H:%M:%S")
+            since = max(since, lastTimestamp)
+
+        updatedAt = time.time()
+        prices = await fetch(since)
+        await self.run(self.store, item, prices, updatedAt)
+
+    def select(self, item, since):
+        """Returns rows of item from since, ordered by location, quality and time."""
+
+        return (
+            self.connect()
+            .execute(
+                """
+                SELECT location, quality, timestamp, price, count FROM history
+                WHERE item = ? AND timestamp >= ?
+                ORDER BY location, quality, timestamp
+                """,
+                (item, since.strftime("%Y-%m-%dT%H:%M:%S")),
+            )
+            .fetchall()
+        )
+
+    async def series(self, item, since):
+        """Returns stored points of item from since, in the charts API format.
+
+        - i.e. list of {"location", "quality", "data"},
+            data has lists "timestamps", "prices_avg" and "item_count".
+        """
+
+        prices = []
+        for (location, quality, timestamp, price, count) in await self.run(
+            self.select, item, since
+        ):
+            if (
+                not prices
+                or prices[-1]["location"] != location
+                or prices[-1]["quality"] != quality
+            ):
+                prices.append(
+                    {
+                        "location": location,
+                        "quality": quality,
+                        "data": {"timestamps": [], "prices_avg": [], "item_count": []},
+                    }
+                )
+
+            data = prices[-1]["data"]
+            data["timestamps"].append(timestamp)
+            data["prices_avg"].append(price)
+            data["item_count"].append(count)
+
+        return prices
@@ -0,0 +1,153 @@
+import json
+import time
+import aiohttp
+from helpers.metrics import observe_upstream, timed
+from helpers.scheduler import RequestScheduler
+from helpers.singleflight import SingleFlight
+
+
+def retry_after(headers, default=5):
+    """Returns seconds of the Retry-After header, or default if missing (or a date)."""
+
+    try:
+        return max(0, float(headers.get("Retry-After")))
+    except:
+        return default
+
+
+class HTTPClient:
+    """Async HTTP client shared by all cogs.
+
+    - Wraps a single aiohttp ClientSession, created on first use
+        (a session has to be created inside the running event loop).
+    - The session's connector keeps a pool of keep-alive connections per host,
+        e.g. albion-online-data.com and gameinfo.albiononline.com.
+    - Upstream calls no longer block the event loop (and every shard) while waiting.
+    - Identical GETs of JSON in flight at the same time are sent only once.
+    - Latency and status of each request are counted by endpoint (helpers.metrics).
+    - Requests to each host are rate limited and queued by priority (helpers.scheduler),
+        a host replying 429 (Too Many Requests) or 503 is left alone for a while.
+
+    Functions:
+        - get_json(url, priority)
+            GET url and return decoded JSON.
+        - get_raw(url, headers, timeout, priority)
+            GET url and return status, headers and body.
+        - close()
+            Close the session and its connections.
+    """
+
+    def __init__(self, limitPerHost=10, keepaliveTimeout=60, timeout=30):
+        self.limitPerHost = limitPerHost
+        self.keepaliveTimeout = keepaliveTimeout
+        self.timeout = timeout
+        self.session = None
+
+        # Coalesces identical in-flight get_json calls, keyed by URL
+        self.flights = SingleFlight()
+
+        # Priority of each flight still waiting for its turn (highest of its callers)
+        self.flightPriorities = {}
+
+        # Token bucket and queue of each host, limits are set from config.ini by main.py
+        self.scheduler = RequestScheduler()
+
+    def get_session(self):
+        """Returns the shared session, (re)creating it if needed."""
+
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limitPerHost,
+                keepalive_timeout=self.keepaliveTimeout,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+        return self.session
+
+    def check_limited(self, url, response):
+        """Pause requests to url's host if response says it is rate limited."""
+
+        if response.status in (429, 503):
+            self.scheduler.pause(url, retry_after(response.headers))
+
+    async def get_json(self, url, priority=None):
+        """GET url and return decoded JSON.
+
+        - Raises aiohttp.ClientResponseError if response status is not OK,
+            same as urlopen raising HTTPError.
+        - Raises helpers.scheduler.Busy, without sending the request,
+            if too many requests to the host are already waiting.
+        - Content type is not checked, some APIs do not send application/json.
+        - Concurrent calls with the same url share one request (and its result).
+            A command joining a request of background work raises its priority,
+            so it does not wait (or get turned away) as background work.
+        """
+
+        priority = self.scheduler.priority(priority)
+        if url not in self.flights.inflight:
+            self.flightPriorities[url] = priority
+        elif url in self.flightPriorities and priority < self.flightPriorities[url]:
+            self.flightPriorities[url] = priority
+            self.scheduler.promote(url, url, priority)
+
+        async def get():
+            try:
+                await self.scheduler.acquire(url, self.flightPriorities[url], ticket=url)
+            finally:
+                self.flightPriorities.pop(url, None)
+
+            start = time.perf_counter()
+            status = "error"
+            try:
+                async with self.get_session().get(url) as response:
+                    status = response.status
+                    self.check_limited(url, response)
+                    response.raise_for_status()
+                    body = await response.read()
+            finally:
+                observe_upstream(url, status, time.perf_counter() - start)
+
+            # Same as response.json (empty body is None), timed on its own
+            with timed("decode"):
+                return json.loads(body) if body.strip() else None
+
+        return await self.flights.do(url, get)
+
+    async def get_raw(self, url, headers=None, timeout=None, priority=None):
+        """GET url and return (status, headers, body bytes).
+
+        - Used for conditional requests (If-None-Match, If-Modified-Since).
+        - timeout (seconds) overrides the default, e.g. for large downloads.
+        - Raises aiohttp.ClientResponseError if response status is an error (>= 400).
+        - Raises helpers.scheduler.Busy if the host's queue is full, same as get_json.
+        """
+
+        options = {"headers": headers}
+        if timeout is not None:
+            options["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        await self.scheduler.acquire(url, priority)
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            async with self.get_session().get(url, **options) as response:
+                status = response.status
+                self.check_limited(url, response)
+                response.raise_for_status()
+                return response.status, response.headers, await response.read()
+        finally:
+            observe_upstream(url, status, time.perf_counter() - start)
+
+    async def close(self):
+        """Close the session and its pooled connections."""
+
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+# Shared by all cogs, survives extension reloads
+httpClient = HTTPClient()
@@ -0,0 +1,331 @@
+import difflib
+from collections import defaultdict
+from helpers.query import base_name, parse_query, split_id, strip_quality
+
+
+def trigrams(word):
+    """Returns the set of character trigrams of a (lowercased) word.
+
+    - Word is padded with spaces so that short words and word edges
+        still produce trigrams.
+    """
+
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def variant_distance(key, tier, enchant):
+    """Sort key of (tier, enchant) variants, closest tier first, then enchantment."""
+
+    return abs(key[0] - tier), abs(key[1] - enchant), key
+
+
+class ItemIndex:
+    """Inverted character-trigram index over items.json.
+
+    - Built once from the item list (UniqueName and all LocalizedNames).
+    - If locales is given (e.g. ["FR-FR"]), only UniqueName and LocalizedNames
+        of those locales are indexed and scored, and matches are named in the first one.
+    - A query first shortlists the items sharing the most trigrams,
+        then only those are scored with difflib, like the full scan used to.
+    - Falls back to scoring every item if the shortlist is too small.
+    - Items without an ID or an English name are left out, as they cannot be shown.
+        English name is shown if an item has no name in the locale.
+    - Exact item IDs and names (English, or of the locales) are looked up directly.
+    - Queries with a tier (e.g. "t6.2 bag", "elder's broadsword@3") only match
+        the item family (e.g. "bag"), the item ID is then built from the tier.
+
+    Functions:
+        - match(inputWord, count)
+            Returns item names and IDs of the closest matches.
+    """
+
+    def __init__(self, itemData, shortlistSize=50, withFamilies=True, locales=None):
+        self.itemData = itemData
+        self.shortlistSize = shortlistSize
+
+        # Indexed locales (None for all), matches are named in the first one
+        self.locales = locales
+        self.displayLocale = locales[0] if locales else "EN-US"
+
+        # Every name (IDs and localized names) gets its own entry
+        # nameItems maps each name entry back to its item index
+        self.nameItems = []
+        self.nameSizes = []
+        self.postings = defaultdict(list)
+
+        # Only items with an ID and an English name can be shown as a match
+        self.searchable = []
+
+        # Exact lookups, by item ID (upper case) and name (lower case)
+        self.byID = {}
+        self.byName = {}
+
+        # Item family (ID without tier and enchantment) -> {(tier, enchant): index}
+        self.families = defaultdict(dict)
+
+        for (i, indivData) in enumerate(itemData):
+            names = set()
+            try:
+                # English name is shown if the item has no name in the locale
+                englishName = indivData["LocalizedNames"]["EN-US"]
+                localNames = self.local_names(indivData)
+                names.add(indivData["UniqueName"].lower())
+                for name in localNames:
+                    names.add(name.lower())
+            except:
+                continue
+
+            self.searchable.append(i)
+            self.byID.setdefault(indivData["UniqueName"].upper(), i)
+
+            # Exact names of the locales, or only English if all locales are indexed
+            for name in localNames if self.locales else [englishName]:
+                self.byName.setdefault(name.lower(), i)
+
+            parts = split_id(indivData["UniqueName"])
+            if parts is not None:
+                (family, tier, enchant) = parts
+                self.families[family].setdefault((tier, enchant), i)
+
+            for name in names:
+                grams = trigrams(name)
+                nameID = len(self.nameItems)
+                self.nameItems.append(i)
+                self.nameSizes.append(len(grams))
+                for gram in grams:
+                    self.postings[gram].append(nameID)
+
+        # Index of item families, named after their lowest tier item
+        # (English name without tier, other languages as they are)
+        # Families are few and distinct, a smaller shortlist is enough
+        self.familyIndex = None
+        if withFamilies:
+            familyData = []
+            for (family, variants) in self.families.items():
+                names = dict(itemData[variants[min(variants)]]["LocalizedNames"])
+                names["EN-US"] = base_name(names["EN-US"])
+                familyData.append({"UniqueName": family, "LocalizedNames": names})
+            self.familyIndex = ItemIndex(
+                familyData,
+                max(10, shortlistSize // 5),
+                withFamilies=False,
+                locales=locales,
+            )
+
+    def local_names(self, indivData):
+        """Returns item's LocalizedNames of the indexed locales (all if locales is None)."""
+
+        localizedNames = indivData["LocalizedNames"]
+        if self.locales is None:
+            return list(localizedNames.values())
+
+        return [localizedNames[l] for l in self.locales if localizedNames.get(l)]
+
+    def display_name(self, i):
+        """Returns name of item i in the display locale, or its English name."""
+
+        localizedNames = self.itemData[i]["LocalizedNames"]
+        return localizedNames.get(self.displayLocale) or localizedNames["EN-US"]
+
+    def shortlist(self, inputWord, loose=False):
+        """Returns indices of the items sharing the most trigrams with inputWord.
+
+        - Each name is scored with the Dice coefficient of the trigram sets.
+        - An item is ranked by its best scoring name.
+        - If loose, any trigram containing a character of inputWord counts as shared.
+            Used for very short or odd queries that share no full trigram.
+        """
+
+        queryGrams = trigrams(inputWord.lower())
+
+        if loose:
+            chars = set(inputWord.lower()) - {" "}
+            queryGrams = {
+                gram for gram in self.postings if any(c in gram for c in chars)
+            }
+
+        # Count shared trigrams for every name that shares at least one
+        shared = defaultdict(int)
+        for gram in queryGrams:
+            for nameID in self.postings.get(gram, ()):
+                shared[nameID] += 1
+
+        # Best Dice coefficient of each item
+        bestScores = {}
+        for (nameID, count) in shared.items():
+            score = 2 * count / (len(queryGrams) + self.nameSizes[nameID])
+            i = self.nameItems[nameID]
+            if score > bestScores.get(i, 0):
+                bestScores[i] = score
+
+        return sorted(bestScores, key=bestScores.get, reverse=True)[
+            : self.shortlistSize
+        ]
+
+    def distances(self, inputWord, indices):
+        """Returns sorted [distance, index] of items, same as the original full scan.
+
+        - Each item gets one entry for its ID (UniqueName),
+            and one for its closest localized name (LocalizedNames).
+        - Distance is 1 - difflib's SequenceMatcher ratio, max distance is 1.
+        """
+
+        w1 = inputWord.lower()
+        jDists = []
+
+        for i in indices:
+            indivData = self.itemData[i]
+
+            # Calculate distance for item ID (UniqueName)
+            try:
+                w2 = indivData["UniqueName"].lower()
+                jDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
+                jDists.append([jDist, i])
+            except:
+                jDists.append([1, i])
+
+            # Calculate distance for closest item name (LocalizedNames)
+            try:
+                localDists = []
+                for name in self.local_names(indivData):
+                    w2 = name.lower()
+                    localDist = 1 - difflib.SequenceMatcher(None, w1, w2).ratio()
+                    localDists.append(localDist)
+                jDists.append([min(localDists), i])
+            except:
+                jDists.append([1, i])
+
+        return sorted(jDists)
+
+    def closest(self, inputWord, count):
+        """Returns sorted [distance, index] of the count closest items, with difflib.
+
+        - Only items in the trigram shortlist are scored.
+        - Loosen the shortlist, then score every item,
+            if the shortlist has less than count items.
+        """
+
+        indices = self.shortlist(inputWord)
+        if len(indices) < count:
+            indices = self.shortlist(inputWord, loose=True)
+        if len(indices) < count:
+            indices = self.searchable
+
+        return self.distances(inputWord, indices)[:count]
+
+    def fuzzy(self, inputWord, count):
+        """Returns indices of the count closest items of inputWord (see closest)."""
+
+        return [jDist[1] for jDist in self.closest(inputWord, count)]
+
+    def siblings(self, i):
+        """Returns indices of the other tiers and enchantments of item i.
+
+        - Closest tier first, then closest enchantment.
+        """
+
+        parts = split_id(self.itemData[i]["UniqueName"])
+        if parts is None:
+            return []
+
+        (family, tier, enchant) = parts
+        variants = self.families[family]
+
+        return [
+            variants[key]
+            for key in sorted(
+                variants, key=lambda key: variant_distance(key, tier, enchant)
+            )
+            if variants[key] != i
+        ]
+
+    def exact(self, inputWord):
+        """Returns index of the item with inputWord as ID or name, or None."""
+
+        i = self.byID.get(inputWord.strip().upper())
+        if i is None:
+            i = self.byName.get(inputWord.strip().lower())
+
+        return i
+
+    def tiered(self, inputWord):
+        """Returns index of the item with the tier and enchantment in inputWord, or None.
+
+        - Only the rest of the query (the item family) is fuzzy matched,
+            e.g. "bag" of "t6.2 bag", then the item is looked up by tier and enchantment.
+        - If the closest families have no such item,
+            the closest tier and enchantment of the closest family is used.
+        - None if the query has no tier.
+        """
+
+        (name, tier, enchant, _) = parse_query(inputWord)
+        if tier is None or not name or self.familyIndex is None:
+            return None
+
+        enchant = enchant or 0
+        families = [
+            self.familyIndex.itemData[f]["UniqueName"]
+            for f in self.familyIndex.fuzzy(name, 2)
+        ]
+        if not families:
+            return None
+
+        for family in families:
+            i = self.families[family].get((tier, enchant))
+            if i is not None:
+                return i
+
+        variants = self.families[families[0]]
+        closest = min(variants, key=lambda key: variant_distance(key, tier, enchant))
+        return variants[closest]
+
+    def resolve(self, inputWord, count=4):
+        """Returns (indices, distance) of the count closest matches of inputWord.
+
+        - Exact item ID or name, then tier and enchantment (see tiered),
+            are looked up first, with other tiers/enchantments of the item as suggestions.
+        - Otherwise, closest items with difflib (see closest).
+        - distance is 0 if looked up, else the difflib distance of the closest item
+            (1 is nothing alike), e.g. to spot queries that match nothing.
+        - Quality words in the query are ignored.
+        """
+
+        inputWord = strip_quality(inputWord)
+
+        i = self.exact(inputWord)
+        if i is None:
+            i = self.tiered(inputWord)
+
+        if i is None:
+            jDists = self.closest(inputWord, count)
+            indices = [jDist[1] for jDist in jDists]
+            distance = jDists[0][0] if jDists else 1
+        else:
+            distance = 0
+            indices = ([i] + self.siblings(i))[:count]
+
+            # Not enough tiers/enchantments of the item for suggestions
+            if len(indices) < count:
+                for j in self.fuzzy(inputWord, count + len(indices)):
+                    if j not in indices:
+                        indices.append(j)
+                indices = indices[:count]
+
+        return indices, distance
+
+    def match(self, inputWord, count=4, withDistance=False):
+        """Returns item names and IDs of the count closest matches of inputWord.
+
+        - See resolve, names are in the display locale.
+        - Also returns distance of the closest match if withDistance.
+        """
+
+        (indices, distance) = self.resolve(inputWord, count)
+
+        itemNames = [self.display_name(i) for i in indices]
+        itemIDs = [self.itemData[i]["UniqueName"] for i in indices]
+
+        if withDistance:
+            return itemNames, itemIDs, distance
+        return itemNames, itemIDs
@@ -0,0 +1,55 @@
+import json
+from helpers import dataPath
+from helpers.catalog import write_atomic
+
+
+class GuildLocales:
+    """Locales (LocalizedNames languages) of each Discord guild, kept on local disk.
+
+    - e.g. {"1234": ["FR-FR", "EN-US"]}, first locale is the one items are named in.
+    - Guilds without a setting match against all locales, named in English.
+    - Saved to /data on every change, small enough to be written at once.
+
+    Functions:
+        - get(guildID)
+            Returns locales of guild, or None.
+        - set(guildID, locales)
+            Set (or clear, if empty) locales of guild, and save.
+        - all()
+            Returns every distinct set of locales in use.
+    """
+
+    def __init__(self, filename="locales.json"):
+        self.path = f"{dataPath}/{filename}"
+
+        try:
+            with open(self.path) as f:
+                self.locales = json.load(f)
+        except FileNotFoundError:
+            self.locales = {}
+        except Exception as e:
+            print(e)
+            self.locales = {}
+
+    def get(self, guildID):
+        """Returns locales of guildID (None for DMs or guilds without a setting)."""
+
+        if guildID is None:
+            return None
+
+        return self.locales.get(str(guildID))
+
+    def set(self, guildID, locales):
+        """Set locales of guildID, an empty list clears the setting."""
+
+        if locales:
+            self.locales[str(guildID)] = list(locales)
+        else:
+            self.locales.pop(str(guildID), None)
+
+        write_atomic(self.path, json.dumps(self.locales, indent=4).encode())
+
+    def all(self):
+        """Returns every distinct set of locales in use, as tuples."""
+
+        return {tuple(locales) for locales in self.locales.values()}
@@ -0,0 +1,331 @@
+import contextlib
+import contextvars
+import re
+import time
+import urllib.parse
+from aiohttp import web
+from helpers.cache import caches
+
+# All metrics by name, rendered in this order on the metrics endpoint
+metrics = {}
+
+# Name of the command being run, so that stages timed anywhere
+# (e.g. upstream requests in helpers.http) are labeled with it
+# Copied into tasks created while the command runs,
+# except background refreshes (see helpers.cache.spawn_background)
+currentCommand = contextvars.ContextVar("currentCommand", default="background")
+
+# Upper bounds (seconds) of the latency histogram buckets
+defaultBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value):
+    """Escape a label value for the Prometheus text format."""
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    """Returns labels dict as {name="value",...}, or an empty string."""
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for (k, v) in labels.items()) + "}"
+
+
+class Histogram:
+    """Latency histogram with labels, in the Prometheus sense.
+
+    - Counts observations in cumulative buckets (le = upper bound),
+        and keeps their sum and count.
+    - One set of buckets for each combination of label values.
+    - Registered in metrics under name.
+
+    Functions:
+        - observe(value, **labels)
+            Count one observation.
+        - quantile(q, **labels)
+            Estimate the q quantile from the buckets.
+        - render()
+            Returns the histogram in the Prometheus text format.
+    """
+
+    def __init__(self, name, help, labelNames, buckets=defaultBuckets):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = list(buckets)
+
+        # Label values -> [bucket counts (not cumulative) + overflow, sum, count]
+        self.series = {}
+
+        metrics[name] = self
+
+    def observe(self, value, **labels):
+        """Count one observation of value (seconds)."""
+
+        key = tuple(str(labels[name]) for name in self.labelNames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        # First bucket with value <= upper bound, or the overflow bucket
+        for (i, bound) in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+
+        series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q, **labels):
+        """Estimate the q quantile (0-1) of the observations with labels.
+
+        - Interpolates inside the bucket, like PromQL histogram_quantile.
+        - Returns None if there are no observations.
+        """
+
+        key = tuple(str(labels[name]) for name in self.labelNames)
+        series = self.series.get(key)
+        if series is None or not series[2]:
+            return None
+
+        (counts, _, count) = series
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for (i, bound) in enumerate(self.buckets):
+            if cumulative + counts[i] >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / counts[i]
+            cumulative += counts[i]
+            lower = bound
+
+        # In the overflow bucket, best guess is the largest bound
+        return self.buckets[-1]
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format."""
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for (key, (counts, total, count)) in sorted(self.series.items()):
+            labels = dict(zip(self.labelNames, key))
+
+            cumulative = 0
+            for (bound, bucketCount) in zip(self.buckets + ["+Inf"], counts):
+                cumulative += bucketCount
+                bucketLabels = format_labels({**labels, "le": bound})
+                lines.append(f"{self.name}_bucket{bucketLabels} {cumulative}")
+
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+
+        return "\n".join(lines)
+
+
+# Time taken by each command, from invoke to return
+commandLatency = Histogram(
+    "bot_command_seconds", "Time taken by each command.", ["command", "status"]
+)
+
+# Time taken by each stage of a command (match, upstream, decode, render, upload...)
+stageLatency = Histogram(
+    "bot_stage_seconds", "Time taken by each stage of a command.", ["command", "stage"]
+)
+
+# Time taken by upstream requests, by endpoint and response status
+upstreamLatency = Histogram(
+    "bot_upstream_seconds",
+    "Time taken by upstream requests, by endpoint and status.",
+    ["endpoint", "status"],
+)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time the block as stage of the current command.
+
+    - Usage: with timed("match"): ...
+    - Also times awaits inside the block, e.g. with timed("upload"): await ctx.send(...)
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stageLatency.observe(
+            time.perf_counter() - start, command=currentCommand.get(), stage=stage
+        )
+
+
+def endpoint_of(url):
+    """Returns the endpoint of url, without item/player/guild IDs and queries.
+
+    - e.g. www.albion-online-data.com/api/v2/stats/prices
+    - Path is cut at the first segment that is not a lower case word,
+        so that the number of endpoints stays small.
+    """
+
+    parts = urllib.parse.urlsplit(url)
+    segments = []
+    for segment in parts.path.split("/"):
+        if not segment:
+            continue
+        if not re.fullmatch(r"[a-z][a-z0-9.\-]*", segment) or len(segments) == 5:
+            break
+        segments.append(segment)
+
+    return "/".join([parts.netloc] + segments)
+
+
+def observe_upstream(url, status, seconds):
+    """Count an upstream request of url, as stage 'upstream' of the current command.
+
+    - status is the response status, or 'error' if there was no response.
+    """
+
+    upstreamLatency.observe(seconds, endpoint=endpoint_of(url), status=status)
+    stageLatency.observe(seconds, command=currentCommand.get(), stage="upstream")
+
+
+def command_started(ctx):
+    """Start timing ctx's command, stages timed until it is done are labeled with it."""
+
+    ctx.metricsStart = time.perf_counter()
+    currentCommand.set(ctx.command.qualified_name)
+
+
+def command_finished(ctx):
+    """Stop timing ctx's command."""
+
+    start = getattr(ctx, "metricsStart", None)
+    if start is None:
+        return
+
+    commandLatency.observe(
+        time.perf_counter() - start,
+        command=ctx.command.qualified_name,
+        status="error" if ctx.command_failed else "ok",
+    )
+
+
+def render_caches():
+    """Returns hit/miss counters and sizes of caches in the Prometheus text format."""
+
+    lines = [
+        "# HELP bot_cache_requests_total Cache lookups, by result (hit, stale, miss).",
+        "# TYPE bot_cache_requests_total counter",
+    ]
+    for cache in caches.values():
+        for (result, count) in [
+            ("hit", cache.hits),
+            ("stale", cache.staleHits),
+            ("miss", cache.misses),
+        ]:
+            labels = format_labels({"cache": cache.name, "result": result})
+            lines.append(f"bot_cache_requests_total{labels} {count}")
+
+    lines += [
+        "# HELP bot_cache_entries Entries in each cache.",
+        "# TYPE bot_cache_entries gauge",
+    ]
+    for cache in caches.values():
+        labels = format_labels({"cache": cache.name})
+        lines.append(f"bot_cache_entries{labels} {len(cache.entries)}")
+
+    return "\n".join(lines)
+
+
+def render_all():
+    """Returns all metrics and caches in the Prometheus text format."""
+
+    return (
+        "\n".join([metric.render() for metric in metrics.values()] + [render_caches()])
+        + "\n"
+    )
+
+
+def summary():
+    """Returns a short text summary of the metrics, for the stats command.
+
+    - Count, mean and estimated p50/p95 of each command, stage and upstream endpoint.
+    - Hit rates of each cache.
+    """
+
+    def row(histogram, key, name):
+        (counts, total, count) = histogram.series[key]
+        labels = dict(zip(histogram.labelNames, key))
+        p50 = histogram.quantile(0.5, **labels) * 1000
+        p95 = histogram.quantile(0.95, **labels) * 1000
+        mean = total / count * 1000
+        return (
+            f"  {name}: {count:,}x, mean {mean:,.0f} ms, "
+            f"p50 {p50:,.0f} ms, p95 {p95:,.0f} ms"
+        )
+
+    lines = ["Commands:"]
+    for key in sorted(commandLatency.series):
+        lines.append(row(commandLatency, key, "/".join(key)))
+
+    lines.append("Stages:")
+    for key in sorted(stageLatency.series):
+        lines.append(row(stageLatency, key, "/".join(key)))
+
+    lines.append("Upstream:")
+    for key in sorted(upstreamLatency.series):
+        lines.append(row(upstreamLatency, key, " ".join(key)))
+
+    lines.append("Caches:")
+    for cache in caches.values():
+        lines.append(f"  {cache.stats()}")
+
+    return "\n".join(lines)
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving all metrics in the Prometheus text format.
+
+    - GET /metrics on host:port (see [Metrics] in config.ini).
+    - Started once, survives extension reloads.
+
+    Functions:
+        - start(host, port)
+            Start serving, does nothing if already started.
+        - stop()
+            Stop serving.
+    """
+
+    def __init__(self):
+        self.runner = None
+
+    async def handle(self, request):
+        return web.Response(
+            body=render_all().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self, host, port):
+        """Start serving /metrics on host:port, if not started yet."""
+
+        if self.runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        """Stop serving /metrics."""
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+# Shared by all cogs, survives extension reloads
+metricsServer = MetricsServer()
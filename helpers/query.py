@@ -0,0 +1,125 @@
+import re
+
+# Tier names, as at the start of English item names, e.g. "Adept's Bag" is tier 4
+# With and without 's, tier is (index % 8) + 1
+tierNames = [
+    "Beginner's",
+    "Novice's",
+    "Journeyman's",
+    "Adept's",
+    "Expert's",
+    "Master's",
+    "Grandmaster's",
+    "Elder's",
+    "Beginner",
+    "Novice",
+    "Journeyman",
+    "Adept",
+    "Expert",
+    "Master",
+    "Grandmaster",
+    "Elder",
+]
+
+# Enchantment names of resources, e.g. "Uncommon" is enchantment 1
+enchantNames = ["Uncommon", "Rare", "Exceptional"]
+
+# Enchantment labels at end of item ID, e.g. T4_BAG@1
+enchantNumbers = ["@1", "@2", "@3"]
+
+# Quality names, quality is index + 1 (same as the APIs)
+qualityNames = ["Normal", "Good", "Outstanding", "Excellent", "Masterpiece"]
+
+# Lower case word -> tier/enchantment/quality
+# Also without apostrophe, e.g. "adepts"
+tierWords = {}
+for (i, name) in enumerate(tierNames):
+    tierWords[name.lower()] = i % 8 + 1
+    tierWords[name.lower().replace("'", "")] = i % 8 + 1
+enchantWords = {name.lower(): i + 1 for (i, name) in enumerate(enchantNames)}
+qualityWords = {name.lower(): i + 1 for (i, name) in enumerate(qualityNames)}
+
+# Tier with optional enchantment, e.g. t6, 6.2, t6.2, t6@2, 8.1
+tierPattern = re.compile(r"t?([1-8])(?:[.@]([0-9]))?")
+
+# Enchantment label at end of a word, e.g. broadsword@3, or @3 on its own
+enchantPattern = re.compile(r"(.*)@([0-9])")
+
+# Item ID of a tiered item, e.g. T4_BAG, T6_2H_CLAYMORE@2, T4_PLANKS_LEVEL1@1
+idPattern = re.compile(r"T([1-8])_(.+?)(?:_LEVEL([0-9]))?(?:@([0-9]))?")
+
+
+def parse_query(inputWord):
+    """Pull tier, enchantment and quality out of a query.
+
+    - Returns (name, tier, enchant, quality), each None if not in the query.
+    - name is what is left of the query (the item family), lower case.
+    - e.g. "T6.2 bag" -> ("bag", 6, 2, None)
+    - e.g. "elder's broadsword@3" -> ("broadsword", 8, 3, None)
+    - e.g. "8.1 cape excellent" -> ("cape", 8, 1, 4)
+    """
+
+    tier = None
+    enchant = None
+    quality = None
+    words = []
+
+    for word in inputWord.lower().split():
+        # Enchantment label at end of word
+        match = enchantPattern.fullmatch(word)
+        if match:
+            (word, enchant) = (match.group(1), int(match.group(2)))
+            if not word:
+                continue
+
+        match = tierPattern.fullmatch(word)
+        if match and tier is None:
+            tier = int(match.group(1))
+            if match.group(2) is not None:
+                enchant = int(match.group(2))
+        elif word in tierWords and tier is None:
+            tier = tierWords[word]
+        elif word in enchantWords and enchant is None:
+            enchant = enchantWords[word]
+        elif word in qualityWords and quality is None:
+            quality = qualityWords[word]
+        else:
+            words.append(word)
+
+    return " ".join(words), tier, enchant, quality
+
+
+def strip_quality(inputWord):
+    """Returns query without its quality words, e.g. "bag excellent" -> "bag"."""
+
+    return " ".join(w for w in inputWord.split() if w.lower() not in qualityWords)
+
+
+def split_id(uniqueName):
+    """Split a tiered item ID into (family, tier, enchant).
+
+    - e.g. T4_PLANKS_LEVEL1@1 -> ("PLANKS", 4, 1)
+    - Returns None if the ID has no tier, e.g. UNIQUE_HIDEOUT.
+    """
+
+    match = idPattern.fullmatch(uniqueName)
+    if match is None:
+        return None
+
+    (tier, family, level, enchant) = match.groups()
+    return family, int(tier), int(enchant or level or 0)
+
+
+def base_name(itemName):
+    """Returns English item name without its tier and enchantment names.
+
+    - e.g. "Adept's Bag" -> "Bag", "Uncommon Adept's Hide" -> "Hide"
+    """
+
+    words = itemName.split()
+    while len(words) > 1 and (
+        words[0].lower() in tierWords or words[0].lower() in enchantWords
+    ):
+        words = words[1:]
+
+    return " ".join(words)
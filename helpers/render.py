@@ -0,0 +1,385 @@
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import io
+import multiprocessing
+import os
+
+
+def warm_up():
+    """Import matplotlib in a worker process, so the first plot is not slowed by it.
+
+    - Also used as the initializer of every worker.
+    - Uses the non-interactive Agg backend, workers have no display.
+    - Builds the worker's HistoryFigure template.
+    """
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+
+    HistoryFigure.get()
+
+
+def use_style(plt):
+    """Use the seaborn style (renamed to seaborn-v0_8 in newer matplotlib)."""
+
+    if "seaborn" in plt.style.available:
+        plt.style.use("seaborn")
+    else:
+        plt.style.use("seaborn-v0_8")
+
+
+class HistoryFigure:
+    """Template of the 6 cities historical prices figure, built once per worker.
+
+    - Figure, axes, styling, shared axes, labels and lines are only created once.
+    - Item count bars of each subplot are one collection of rectangles,
+        instead of one artist per bar.
+    - Each plot only updates line data, item count bars, titles and limits,
+        before saving the figure.
+    - Price lines are downsampled (LTTB) to at most one point per pixel of their axes.
+
+    Functions:
+        - get()
+            Returns the template of this worker process, building it if needed.
+        - draw(item, itemName, timestampsAll, prices_minAll, itemCountsAll)
+            Update the template with the data and return the PNG bytes.
+    """
+
+    # Plot labels and plot colors
+    names = [
+        "Arthur's Rest",
+        "Black Market",
+        "Bridgewatch",
+        "Caerleon",
+        "Fort Sterling",
+        "Lymhurst",
+        "Martlock",
+        "Merlyn's Rest",
+        "Morgana's Rest",
+        "Thetford",
+    ]
+    colors = [
+        "red",
+        "rosybrown",
+        "orange",
+        "black",
+        "slategrey",
+        "forestgreen",
+        "blue",
+        "darkturquoise",
+        "purple",
+        "brown",
+    ]
+    plotOrders = [3, 2, 4, 5, 6, 9]
+
+    # Template of this worker process
+    template = None
+
+    @classmethod
+    def get(cls):
+        """Returns the template of this worker process, building it if needed."""
+
+        if cls.template is None:
+            cls.template = cls()
+
+        return cls.template
+
+    def __init__(self):
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        import matplotlib.gridspec as gridspec
+        from matplotlib.collections import PolyCollection
+
+        use_style(plt)
+        fig, ax = plt.subplots(
+            nrows=3, ncols=2, figsize=(15, 8.75), sharex=True, sharey=True
+        )
+        ax = ax.flatten()
+
+        self.fig = fig
+        self.title = fig.suptitle("")
+
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        plt.subplots_adjust(wspace=0.025, hspace=0.15)
+
+        # Axes, lines and item count bars of each subplot
+        self.priceAxes = []
+        self.countAxes = []
+        self.grayLines = []
+        self.mainLines = []
+        self.bars = []
+
+        # Bars in the first color of the style, same as ax.bar
+        barColor = plt.rcParams["axes.prop_cycle"].by_key()["color"][0]
+
+        for j in range(6):
+            # Create gridspec in each subplot
+            gs = gridspec.GridSpecFromSubplotSpec(
+                2,
+                1,
+                subplot_spec=ax[j].get_subplotspec(),
+                height_ratios=[4, 1],
+                hspace=0.1,
+            )
+
+            # Remove the placeholder subplot (older matplotlib did this on overlap)
+            ax[j].remove()
+
+            # First grid is for prices
+            ax0 = fig.add_subplot(gs[0])
+            # Second grid for item counts, sharing y with first item counts axis
+            if j > 0:
+                ax1 = fig.add_subplot(gs[1], sharex=ax0, sharey=self.countAxes[0])
+            else:
+                ax1 = fig.add_subplot(gs[1], sharex=ax0)
+
+            # Timestamps are given as matplotlib dates (days)
+            ax0.xaxis_date()
+            ax1.xaxis_date()
+
+            # All cities in gray, then the main city on top
+            self.grayLines.append(
+                [ax0.plot([], [], color="gray", alpha=0.3)[0] for i in self.plotOrders]
+            )
+            self.mainLines.append(
+                ax0.plot([], [], color=self.colors[self.plotOrders[j]])[0]
+            )
+            self.bars.append(
+                ax1.add_collection(
+                    PolyCollection([], facecolors=barColor, linewidths=0)
+                )
+            )
+
+            # Only show axis for left and bottom
+            plt.setp(ax0.get_xticklabels(), visible=False)
+            if j % 2:
+                plt.setp(ax0.get_yticklabels(), visible=False)
+                plt.setp(ax1.get_yticklabels(), visible=False)
+            else:
+                ax0.set_ylabel("Silvers")
+                ax1.set_ylabel("Volume")
+            if j not in (4, 5):
+                plt.setp(ax1.get_xticklabels(), visible=False)
+
+            # Title and date axis
+            ax0.set_title(f"{self.names[self.plotOrders[j]]}")
+            ax1.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
+
+            self.priceAxes.append(ax0)
+            self.countAxes.append(ax1)
+
+    def draw(self, item, itemName, timestampsAll, prices_minAll, itemCountsAll):
+        """Update the template with the data and return the PNG bytes."""
+
+        import numpy as np
+        import matplotlib.dates as mdates
+        from helpers.stats import lttb
+
+        self.title.set_text(f"7 Days Sell Order Prices for {itemName} ({item})")
+
+        # Timestamps as matplotlib dates
+        dates = [mdates.date2num(timestamps) for timestamps in timestampsAll]
+
+        # Price lines of each city, at most one point per pixel of a subplot
+        width = int(self.priceAxes[0].get_window_extent().width)
+        lines = []
+        for (x, prices) in zip(dates, prices_minAll):
+            keep = lttb(x, prices, width)
+            lines.append((x[keep], np.asarray(prices)[keep]))
+
+        for j in range(6):
+            main = self.plotOrders[j]
+            ax0 = self.priceAxes[j]
+            ax1 = self.countAxes[j]
+
+            for line, i in zip(self.grayLines[j], self.plotOrders):
+                line.set_data(*lines[i])
+            self.mainLines[j].set_data(*lines[main])
+
+            # Rectangles of width 0.04 (days) centered on each timestamp
+            x = dates[main]
+            counts = np.asarray(itemCountsAll[main], dtype=float)
+            zeros = np.zeros_like(x)
+            self.bars[j].set_verts(
+                np.stack(
+                    [
+                        x - 0.02,
+                        zeros,
+                        x - 0.02,
+                        counts,
+                        x + 0.02,
+                        counts,
+                        x + 0.02,
+                        zeros,
+                    ],
+                    axis=1,
+                ).reshape(-1, 4, 2)
+            )
+
+            # Item count axis shares x with the prices axis
+            ax0.relim()
+            ax0.autoscale_view()
+
+        # Item count axes share y, collections are not part of relim
+        # Only plotted cities count, e.g. Black Market volume would flatten the others
+        top = max(
+            (itemCountsAll[i].max() for i in self.plotOrders if len(itemCountsAll[i])),
+            default=0,
+        )
+        self.countAxes[0].set_ylim(0, top * 1.05 or 1)
+
+        buffer = io.BytesIO()
+        self.fig.savefig(buffer, format="png", bbox_inches="tight")
+
+        return buffer.getvalue()
+
+
+def plot_history(item, itemName, timestampsAll, prices_minAll, itemCountsAll):
+    """Plot 7 days historical prices of 6 cities and return the PNG bytes.
+
+    - Runs in a worker process, using the worker's HistoryFigure template.
+    - Each city has a price line (other cities in gray) and an item count bar plot.
+    - Lists have 10 arrays for the 10 cities in alphabetical order (see grabHistory).
+    """
+
+    return HistoryFigure.get().draw(
+        item, itemName, timestampsAll, prices_minAll, itemCountsAll
+    )
+
+
+def plot_gold(timeStamps, goldPrices, numDays):
+    """Plot past numDays gold prices and return the PNG bytes.
+
+    - Runs in a worker process.
+    - Long ranges are downsampled (LTTB) to at most one point per pixel of the axes,
+        so render time does not grow with numDays.
+    """
+
+    import numpy as np
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from helpers.stats import lttb
+
+    # Plot the data
+    use_style(plt)
+    fig = plt.figure(figsize=(9, 5))
+
+    # At most one point per pixel of the axes
+    keep = lttb(timeStamps, goldPrices, int(plt.gca().get_window_extent().width))
+    timeStamps = np.asarray(timeStamps)[keep]
+    goldPrices = np.asarray(goldPrices)[keep]
+
+    # Settings for date xaxis
+    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%m/%d/%Y"))
+    plt.gca().xaxis.set_major_locator(mdates.AutoDateLocator())
+
+    plt.plot(timeStamps, goldPrices, ".-", color="goldenrod")
+
+    plt.gcf().autofmt_xdate()
+    plt.title(f"Past {numDays} Days Gold Prices")
+    plt.xlabel("Dates")
+    plt.ylabel("Prices")
+
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format="png", bbox_inches="tight")
+
+    # Only close this figure, HistoryFigure's template is kept open
+    plt.close(fig)
+
+    return buffer.getvalue()
+
+
+class Renderer:
+    """Pool of warm worker processes that render plots to PNG bytes.
+
+    - Plots are rendered off the event loop, and in parallel across cores.
+    - Plots are returned as bytes, so there are no shared plot files
+        for concurrent commands to overwrite.
+    - Workers are started (forked) once, before the bot starts running.
+    - If a worker dies, new workers are started with forkserver (or spawn),
+        forking the running bot (and its threads) could deadlock them.
+
+    Functions:
+        - render(function, *args)
+            Run a plot function in a worker and return its PNG bytes.
+        - start()
+            Start all workers and import matplotlib in them.
+        - shutdown()
+            Stop all workers.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.pool = None
+
+        # Number of times the pool broke and was started again
+        self.restarts = 0
+
+    def get_pool(self):
+        """Returns the worker pool, creating it if needed."""
+
+        if self.pool is None:
+            # Fork where available, it is fastest to start
+            # Only before the bot runs, a process with threads is not safe to fork
+            # Spawned workers import main.py again, which only starts the bot as a script
+            startMethods = multiprocessing.get_all_start_methods()
+            if "fork" in startMethods and not self.restarts:
+                context = multiprocessing.get_context("fork")
+            elif "forkserver" in startMethods:
+                context = multiprocessing.get_context("forkserver")
+            else:
+                context = multiprocessing.get_context("spawn")
+
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=warm_up
+            )
+
+        return self.pool
+
+    async def render(self, function, *args):
+        """Run function(*args) in a worker process and return its result.
+
+        - If a worker died (e.g. killed when out of memory), the pool is broken
+            and every later render would fail, so the pool is started again
+            (without forking, see get_pool) and the render retried once.
+        """
+
+        loop = asyncio.get_running_loop()
+        pool = self.get_pool()
+        try:
+            return await loop.run_in_executor(pool, function, *args)
+        except concurrent.futures.process.BrokenProcessPool as e:
+            print(e)
+
+            # Renders waiting on the same broken pool only start one new pool
+            if self.pool is pool:
+                self.pool = None
+                self.restarts += 1
+                pool.shutdown(wait=False)
+
+            return await loop.run_in_executor(self.get_pool(), function, *args)
+
+    def start(self):
+        """Start all workers and wait for them to import matplotlib.
+
+        - Call before the bot starts running,
+            so that workers are forked from a process without the bot's threads,
+            and no command has to wait for a worker to start.
+        """
+
+        pool = self.get_pool()
+        concurrent.futures.wait([pool.submit(warm_up) for _ in range(self.workers)])
+
+    def shutdown(self):
+        """Stop all workers."""
+
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+# Shared by all cogs, survives extension reloads
+renderer = Renderer()
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import itertools
+import time
+import urllib.parse
+from helpers.metrics import currentCommand
+
+# Request priorities, lower goes first
+# Commands (price, search, gold) go ahead of background work (item list, refreshes)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class Busy(Exception):
+    """Raised instead of sending a request when the host's queue is full.
+
+    - retryAfter is the estimated number of seconds until the queue has room again.
+    """
+
+    def __init__(self, host, retryAfter):
+        self.host = host
+        self.retryAfter = retryAfter
+        super().__init__(f"{host} is busy, retry in {retryAfter:.0f}s")
+
+
+class TokenBucket:
+    """Token bucket, refilled at rate tokens per second, up to burst tokens.
+
+    - Starts full, so a quiet host can take a burst of requests at once.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updatedAt = time.monotonic()
+
+        # No tokens are given out before this time (e.g. after a 429)
+        self.pausedUntil = 0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    def take(self):
+        """Take one token, returns seconds to wait (0 if a token was taken)."""
+
+        now = time.monotonic()
+        if now < self.pausedUntil:
+            return self.pausedUntil - now
+
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Give out no tokens for seconds, and start again with an empty bucket."""
+
+        self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updatedAt = self.pausedUntil
+
+
+class HostScheduler:
+    """Request scheduler of one upstream host.
+
+    - Requests are sent as fast as the token bucket allows.
+    - Requests that have to wait are queued, and sent by priority,
+        then in order of arrival.
+    - Only maxQueue requests may wait, more are turned away with Busy.
+        If the queue is full, a request pushes out the latest one of lower priority,
+        so background work is turned away before commands.
+
+    Functions:
+        - acquire(priority, ticket)
+            Wait for this host's turn to send one request.
+        - promote(ticket, priority)
+            Raise the priority of a waiting request.
+        - pause(seconds)
+            Stop sending requests for seconds (e.g. host replied 429).
+    """
+
+    def __init__(self, host, rate, burst, maxQueue):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.maxQueue = maxQueue
+
+        # Heap of (priority, arrival, future, ticket) of waiting requests
+        self.queue = []
+        self.arrivals = itertools.count()
+        self.pump = None
+
+        self.sent = 0
+        self.rejected = 0
+
+    def retry_after(self):
+        """Estimated seconds until the queue has room again."""
+
+        now = time.monotonic()
+        return (
+            max(0, self.bucket.pausedUntil - now) + len(self.queue) / self.bucket.rate
+        )
+
+    async def acquire(self, priority=INTERACTIVE, ticket=None):
+        """Wait until a request to this host can be sent.
+
+        - Raises Busy if maxQueue requests are already waiting.
+        - ticket names the request while it waits, so that promote can find it.
+        """
+
+        # Nothing waiting, send straight away if there is a token
+        if not self.queue and self.bucket.take() == 0:
+            self.sent += 1
+            return
+
+        if len(self.queue) >= self.maxQueue:
+            self.rejected += 1
+            busy = Busy(self.host, max(1, self.retry_after()))
+
+            # Push out the latest request of the lowest priority, if lower than this one
+            latest = max(self.queue)
+            if latest[0] <= priority:
+                raise busy
+            self.queue.remove(latest)
+            heapq.heapify(self.queue)
+            if not latest[2].done():
+                latest[2].set_exception(busy)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.arrivals), future, ticket))
+
+        if self.pump is None or self.pump.done():
+            self.pump = asyncio.ensure_future(self.run())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled while waiting, give up its place in the queue
+            if not future.done():
+                future.cancel()
+            raise
+
+        self.sent += 1
+
+    async def run(self):
+        """Hand out tokens to waiting requests, highest priority first."""
+
+        while self.queue:
+            wait = self.bucket.take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            # Skip requests cancelled while waiting, their token goes to the next one
+            while self.queue:
+                (_, _, future, _) = heapq.heappop(self.queue)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self.bucket.tokens += 1
+
+    def promote(self, ticket, priority):
+        """Raise the priority of the waiting request of ticket, keeping its arrival.
+
+        - e.g. a command waiting on a request that background work started.
+        - Does nothing if no request of ticket is waiting, or its priority is as high.
+        """
+
+        for (i, (oldPriority, arrival, future, oldTicket)) in enumerate(self.queue):
+            if oldTicket == ticket and not future.done():
+                if priority < oldPriority:
+                    self.queue[i] = (priority, arrival, future, ticket)
+                    heapq.heapify(self.queue)
+                return
+
+    def pause(self, seconds):
+        """Stop sending requests to this host for seconds."""
+
+        self.bucket.pause(seconds)
+
+    def stats(self):
+        """Returns sent/rejected counters and queue length as a string."""
+
+        return (
+            f"{self.host}: {self.sent:,} sent, {self.rejected:,} busy, "
+            f"{len(self.queue)} waiting"
+        )
+
+
+class RequestScheduler:
+    """Per host request schedulers of all upstream APIs.
+
+    - One HostScheduler (token bucket and queue) for each host, created on first use.
+    - Priority defaults to INTERACTIVE inside a command,
+        and BACKGROUND outside of one (tasks, e.g. item list refresh).
+    - Rates can be set for each host, others use the default rate.
+
+    Functions:
+        - configure(rate, burst, maxQueue, hostRates)
+            Set default and per host limits.
+        - priority(priority)
+            Returns priority, or the default one of the current task.
+        - acquire(url, priority, ticket)
+            Wait for the turn of url's host.
+        - promote(url, ticket, priority)
+            Raise the priority of a request waiting for url's host.
+        - pause(url, seconds)
+            Stop sending requests to url's host for seconds.
+    """
+
+    def __init__(self, rate=5, burst=10, maxQueue=50):
+        self.rate = rate
+        self.burst = burst
+        self.maxQueue = maxQueue
+        self.hostRates = {}
+        self.hosts = {}
+
+    def configure(self, rate, burst, maxQueue, hostRates=None):
+        """Set default rate (per second), burst and maxQueue, and per host rates.
+
+        - Hosts already in use keep their queue and are given the new limits.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.maxQueue = maxQueue
+        self.hostRates = hostRates or {}
+
+        for (host, scheduler) in self.hosts.items():
+            scheduler.bucket.rate = self.hostRates.get(host, rate)
+            scheduler.bucket.burst = burst
+            scheduler.maxQueue = maxQueue
+
+    def host(self, url):
+        """Returns scheduler of url's host, creating it if needed."""
+
+        host = urllib.parse.urlsplit(url).netloc
+        scheduler = self.hosts.get(host)
+        if scheduler is None:
+            scheduler = self.hosts[host] = HostScheduler(
+                host, self.hostRates.get(host, self.rate), self.burst, self.maxQueue
+            )
+
+        return scheduler
+
+    def priority(self, priority=None):
+        """Returns priority, or if None, the priority of the current command or task."""
+
+        if priority is None:
+            if currentCommand.get() == "background":
+                return BACKGROUND
+            return INTERACTIVE
+
+        return priority
+
+    async def acquire(self, url, priority=None, ticket=None):
+        """Wait for the turn of url's host, raises Busy if its queue is full."""
+
+        await self.host(url).acquire(self.priority(priority), ticket)
+
+    def promote(self, url, ticket, priority):
+        """Raise the priority of the request of ticket waiting for url's host."""
+
+        self.host(url).promote(ticket, priority)
+
+    def pause(self, url, seconds):
+        """Stop sending requests to url's host for seconds."""
+
+        self.host(url).pause(seconds)
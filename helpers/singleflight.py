@@ -0,0 +1,41 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls into one.
+
+    - The first caller of a key starts the work,
+        callers of the same key arriving before it is done await the same result.
+    - Work is shielded, so a caller being cancelled does not cancel it for the others.
+    - Nothing is kept once the work is done, this is not a cache.
+
+    Functions:
+        - do(key, function)
+            Returns result of function(), shared with concurrent callers of key.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+        # Number of calls that did not have to do the work themselves
+        self.coalesced = 0
+
+    async def do(self, key, function):
+        """Returns the awaited result of function(), or of the in-flight call of key."""
+
+        future = self.inflight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(function())
+            self.inflight[key] = future
+
+            def done(_):
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+
+            future.add_done_callback(done)
+
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(future)
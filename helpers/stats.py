@@ -0,0 +1,84 @@
+import numpy as np
+
+
+def outlier_mask(data, m=10):
+    """Returns a boolean mask of the values in data that are not outliers.
+
+    - A value is an outlier if its distance to the median is at least
+        m times the median absolute deviation (MAD).
+    - If MAD is 0, nothing is an outlier.
+    - Median is computed once, for the whole array.
+    """
+
+    data = np.asarray(data, dtype=float)
+    if data.size == 0:
+        return np.zeros(0, dtype=bool)
+
+    d = np.abs(data - np.median(data))
+    mdev = np.median(d)
+    if not mdev:
+        return np.ones(data.size, dtype=bool)
+
+    return d / mdev < m
+
+
+def robust_mean(data, m=10):
+    """Returns mean of data, without outliers (see outlier_mask).
+
+    - Raises ValueError if data is empty, like statistics.mean.
+    """
+
+    data = np.asarray(data, dtype=float)
+    if data.size == 0:
+        raise ValueError("robust_mean requires at least one data point")
+
+    return data[outlier_mask(data, m)].mean()
+
+
+def lttb(x, y, threshold):
+    """Returns indices of threshold points of (x, y) that keep the shape of the line.
+
+    - Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+    - First and last points are always kept. Points in between are split in
+        threshold - 2 buckets, and the point of each bucket making the largest
+        triangle with the previous kept point and the next bucket's mean is kept.
+    - x must be increasing, datetime64 is taken as its integer value.
+    - Returns all indices if there are no more than threshold points.
+    """
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket edges of the points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    for i in range(threshold - 2):
+        (start, end) = (edges[i], edges[i + 1])
+
+        # Mean of the next bucket (the last point for the last bucket)
+        if i + 2 < len(edges):
+            nextX = x[end : edges[i + 2]].mean()
+            nextY = y[end : edges[i + 2]].mean()
+        else:
+            (nextX, nextY) = (x[-1], y[-1])
+
+        # Twice the triangle areas with the previous kept point
+        (prevX, prevY) = (x[indices[i]], y[indices[i]])
+        areas = np.abs(
+            (prevX - nextX) * (y[start:end] - prevY)
+            - (prevX - x[start:end]) * (nextY - prevY)
+        )
+        indices[i + 1] = start + np.argmax(areas)
+
+    return indices
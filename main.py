@@ -3,6 +3,13 @@ from discord.ext import commands
 import os
 import logging
 import configparser
+import time
+from helpers.http import httpClient
+from helpers.render import renderer
+from helpers.metrics import metricsServer, command_started, command_finished
+from helpers.scheduler import Busy
+from helpers.analytics import analytics
+from helpers.gameinfo import entityCache
 
 
 # Load config.ini
@@ -14,25 +21,62 @@ configs.read(currentPath + "/config.ini")
 adminUsers = configs["General"]["adminUsers"].replace("'", "").split(", ")
 commandPrefix = configs["General"]["commandPrefix"].replace("'", "").split(", ")
 
-client = commands.AutoShardedBot(
-    command_prefix=commands.when_mentioned_or(*commandPrefix), case_insensitive=True
+# Cogs slower than this to load are flagged in the startup report
+importBudget = configs["General"].getfloat("importBudget", fallback=500)
+
+# Rate limits of upstream API hosts, e.g. 'www.albion-online-data.com: 1'
+hostRates = {}
+for hostRate in configs["Upstream"]["hostRates"].split(","):
+    if ":" in hostRate:
+        (host, rate) = hostRate.split(":")
+        hostRates[host.strip()] = float(rate)
+httpClient.scheduler.configure(
+    rate=configs["Upstream"].getfloat("rate"),
+    burst=configs["Upstream"].getint("burst"),
+    maxQueue=configs["Upstream"].getint("maxQueue"),
+    hostRates=hostRates,
 )
 
-# Set up logging to discord.log
-logger = logging.getLogger("discord")
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-handler.setFormatter(
-    logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s")
+# Counters of commands, guilds, items and unmatched queries, saved to /data
+analytics.configure(
+    keep=configs["Analytics"].getint("keep"),
+    maxDistance=configs["Analytics"].getfloat("unmatchedDistance"),
 )
-logger.addHandler(handler)
 
+# Local metrics endpoint (Prometheus text format)
+metricsHost = configs["Metrics"]["host"]
+metricsPort = configs["Metrics"].getint("port")
+
+
+class Bot(commands.AutoShardedBot):
+    """AutoShardedBot that also stops the shared helpers on shutdown.
+
+    - Closes the shared HTTP client.
+    - Stops the render workers.
+    - Stops the metrics endpoint.
+    - Saves the analytics counters and cached search results.
+    """
+
+    async def close(self):
+        analytics.flush()
+        entityCache.flush()
+        await metricsServer.stop()
+        await httpClient.close()
+        renderer.shutdown()
+        await super().close()
+
+
+client = Bot(
+    command_prefix=commands.when_mentioned_or(*commandPrefix), case_insensitive=True
+)
 
 @client.event
 async def on_ready():
     """Things to do when bot is ready.
 
     - Load all cogs in folder /cogs.
+    - Print how long each cog took to load (import and setup).
+    - Start the metrics endpoint.
     - Change activity to 'Ready'.
     - Login messages in console:
         Logged in username.
@@ -42,9 +86,11 @@ async def on_ready():
     # Remove default help command (before loading of cogs)
     client.remove_command("help")
 
-    # Load cogs in folder /cogs
+    # Load cogs in folder /cogs, timing each of them
+    loadTimes = {}
     for filename in os.listdir(currentPath + "/cogs"):
         if filename.endswith(".py"):
+            start = time.perf_counter()
             try:
                 client.load_extension(f"cogs.{filename[:-3]}")
             except Exception as e:
@@ -52,6 +98,21 @@ async def on_ready():
                 # reload again when load fails (no idea why this works)
                 client.reload_extension(f"cogs.{filename[:-3]}")
                 pass
+            loadTimes[filename[:-3]] = (time.perf_counter() - start) * 1000
+
+    # Cog load time report in console, slowest first
+    print("Cog load times:")
+    for (cog, loadTime) in sorted(loadTimes.items(), key=lambda x: -x[1]):
+        flag = " (over budget)" if loadTime > importBudget else ""
+        print(f"  {cog}: {loadTime:.1f} ms{flag}")
+    print(f"  total: {sum(loadTimes.values()):.1f} ms")
+
+    # Serve metrics on the local endpoint, unless port is 0
+    if metricsPort:
+        try:
+            await metricsServer.start(metricsHost, metricsPort)
+        except Exception as e:
+            print(e)
 
     # Activity to 'Ready'
     await client.change_presence(activity=discord.Game("Ready"))
@@ -67,6 +128,40 @@ async def on_ready():
             break
 
 
+@client.before_invoke
+async def before_command(ctx):
+    """Start timing each command (see helpers.metrics).
+
+    - Also counts the command and its guild (see helpers.analytics).
+    """
+
+    command_started(ctx)
+    analytics.record_command(ctx)
+
+
+@client.after_invoke
+async def after_command(ctx):
+    """Stop timing each command, also called when the command fails."""
+
+    command_finished(ctx)
+
+
+@client.event
+async def on_command_error(ctx, error):
+    """Ask users to retry later if an upstream API is busy (see helpers.scheduler).
+
+    - Other errors are handled as before (printed, unless the command handles them).
+    """
+
+    # Commands raise CommandInvokeError, with the Busy exception as original
+    original = getattr(error, "original", error)
+    if isinstance(original, Busy):
+        await ctx.send(f"Busy, please retry in {original.retryAfter:.0f}s.")
+        return
+
+    await commands.AutoShardedBot.on_command_error(client, ctx, error)
+
+
 @client.command()
 async def extension(ctx, option, extension):
     """Reload, load, or unload extensions.
@@ -104,6 +199,23 @@ async def extension(ctx, option, extension):
     await ctx.send(f"{extension} extension {option.upper()}ED.")
 
 
-# Copy from your Discord developer portal
-token = configs["TOKEN"]["botToken"]
-client.run(token)
+# Only when run as a script
+# Spawned render workers (e.g. on Windows) import this file again as __mp_main__,
+# they must not truncate the log, start more workers or run the bot
+if __name__ == "__main__":
+
+    # Set up logging to discord.log
+    logger = logging.getLogger("discord")
+    logger.setLevel(logging.DEBUG)
+    handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s")
+    )
+    logger.addHandler(handler)
+
+    # Start the render workers before the bot starts running
+    renderer.start()
+
+    # Copy from your Discord developer portal
+    token = configs["TOKEN"]["botToken"]
+    client.run(token)